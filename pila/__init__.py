@@ -15,13 +15,25 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
+__version__ = '0.2.0'
 
 import pila.builders
 import pila.configuration
+import pila.critpath
+import pila.deadunits
 import pila.project
 import pila.events
+import pila.footprint
 import pila.cmake
+import pila.compdb
+import pila.ninja
+import pila.objcache
+import pila.pch
+import pila.registry
+import pila.stackusage
+import pila.trace
 import os
+import SCons.Script
 
 
 def generate(env):
@@ -32,14 +44,54 @@ def generate(env):
         VARIANT_DIR='build',
         DOT_CONFIG='.config',
         TOPLEVEL_KCONFIG='Kconfig.generated',
+        KCONFIG_CACHE='.kconfig.cache',
+        DEFCONFIG='defconfig',
         CONFIG_MODULE_NAME='config',
+        CONFIG_SNAPSHOT='${DOT_CONFIG}.snapshot',
         CONFIG_HEADER='config.pila.h',
-        PILA_BUILTINS=[],
-        PILA_OBJECTS=[],
+        CONFIG_STAMP_DIR='config-stamps',
+        ENABLE_CONFIG_SYMBOL_DEPS=False,
+        GRAPH_SNAPSHOT='.pila.graph',
+        ENABLE_GRAPH_SNAPSHOT=False,
+        BUILT_IN_STRATEGY='ld',
+        BUILT_IN_WHOLE_ARCHIVE=True,
+        BUILT_IN_CHUNK_SIZE=0,
+        ENABLE_LTO=False,
+        LTO_JOBS='auto',
+        LTO_CCFLAGS='-flto',
+        LTO_LINKFLAGS='-flto=$LTO_JOBS',
+        LTO_AR='${CC}-ar',
+        LINKFLAGSPREFIX='',
+        HOT_CODE_PROFILE='',
+        HOT_CODE_BUDGET=16384,
+        ENABLE_STACK_USAGE=False,
+        STACK_BUDGETS={},
+        ENABLE_FOOTPRINT=False,
+        ENABLE_DEAD_UNIT_ELIMINATION=False,
+        DEAD_UNITS_CACHE='.pila.deadunits',
+        ENABLE_UNITY_BUILD=False,
+        UNITY_GROUP_SIZE=8,
+        UNITY_EXCLUDE=[],
+        PCH_HEADERS=[],
+        _PILA_CONFIG_FLAGS=pila.pch.config_flags,
+        FOOTPRINT_BASELINE='',
+        FOOTPRINT_BUDGETS={},
+        FOOTPRINT_GROWTH_BUDGETS={},
+        _PILA_LINK_SOURCES=pila.builders.link_sources,
+        PILA_BUILTINS=pila.registry.Registry(),
+        PILA_OBJECTS=pila.registry.Registry(),
         PILA_KCONFIG_PROJECT_PREFIX_LIST=[],
         CCFLAGS_OPT='-O1',
+        OPT_PROFILES={'size': '-Os', 'speed': '-O2', 'debug': '-Og'},
+        PILA_PROJECT_OPT_PROFILES=[],
+        _PILA_CCFLAGS_OPT=pila.project.opt_flags,
         ASFLAGSPRFIX_CC='-Wa,',
-        ENABLE_CMAKE_GEN=False
+        ENABLE_CMAKE_GEN=False,
+        ENABLE_NINJA_GEN=False,
+        ENABLE_COMPILE_COMMANDS_GEN=False,
+        OBJCACHE_DIR='',
+        OBJCACHE_SIZE='5G',
+        PILA_TRACE_FILE='pila-trace.json'
     )
     env['AR'] = '${CROSS_COMPILE}ar'
     env['AS'] = '${CROSS_COMPILE}as'
@@ -50,6 +102,7 @@ def generate(env):
     # search path based on exact machine type
     env['LINK'] = '${CROSS_COMPILE}ld'
     env['RANLIB'] = '${CROSS_COMPILE}ranlib'
+    env['READELF'] = '${CROSS_COMPILE}readelf'
 
     # Customize assembler with preprocessor flags with CCFLAGS. All
     # ASFLAGS need to be prefixed with -Wa, option (set via
@@ -61,18 +114,45 @@ def generate(env):
     env.AddMethod(pila.builders.ComponentProgram, 'ComponentProgram')
     env.AddMethod(pila.builders.FeatureSConscript, 'FeatureSConscript')
     env.AddMethod(pila.builders.BuiltInObject, 'BuiltInObject')
+    env.AddMethod(pila.pch.PrecompiledHeader, 'PrecompiledHeader')
     env.AddMethod(pila.configuration.LoadBuildEnv, 'LoadBuildEnv')
     env.AddMethod(pila.project.LoadProject, 'LoadProject')
     env.AddMethod(pila.project.ProjectSConscript, 'ProjectSConscript')
-    env.Append(CCFLAGS='$CCFLAGS_OPT')
+    # Optimization flags may be selected per project or per feature object
+    # (see project.opt_flags)
+    env.Append(CCFLAGS='$_PILA_CCFLAGS_OPT')
 
     # Short message for GCC when verbosity is not desired
     pila.verbosity.load_short_messages_gcc(env)
 
     pila.configuration.generate(env)
 
+    if env['OBJCACHE_DIR']:
+        pila.objcache.setup(env)
+
+    if env['ENABLE_DEAD_UNIT_ELIMINATION']:
+        pila.deadunits.setup(env)
+
+    if pila.trace.tracer is not None:
+        pila.trace.tracer.setup(env)
+
+    if pila.critpath.target_name in SCons.Script.COMMAND_LINE_TARGETS:
+        pila.critpath.setup(env)
+
     if env['ENABLE_CMAKE_GEN']:
         pila.events.dispatcher.subscribe(pila.cmake.CMakeGen())
 
+    if env['ENABLE_NINJA_GEN']:
+        pila.events.dispatcher.subscribe(pila.ninja.NinjaGen())
+
+    if env['ENABLE_COMPILE_COMMANDS_GEN']:
+        pila.events.dispatcher.subscribe(pila.compdb.CompileCommandsGen())
+
+    if env['ENABLE_STACK_USAGE']:
+        pila.stackusage.setup(env)
+
+    if env['ENABLE_FOOTPRINT']:
+        pila.events.dispatcher.subscribe(pila.footprint.FootprintAnalyzer())
+
 def exists(env):
     return 1
@@ -15,27 +15,154 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
+import zlib
+import SCons.Errors
+import SCons.Warnings
 import pila.verbosity
 import pila.events
+import pila.hotcode
+import pila.pch
+import pila.configdeps
+import pila.deadunits
+import pila.registry
+import pila.unity
 
-def FeatureObject(env, target=None, source=None, is_enabled=True, *args, **kw):
+
+class BuiltInStrategyWarning(SCons.Warnings.Warning):
+    pass
+
+
+# Forms of built-in objects: (suffix, command, short message). Archives
+# are recreated from scratch so that no stale members are left behind,
+# thin archives only refer to the feature objects and are cheap to
+# recreate when a single object changes.
+built_in_strategies = {
+    'ld': ('.o', '$LINK -r -o $TARGET $SOURCES', '[LD-builtin] $TARGET'),
+    'thin-archive': ('.a', 'rm -f $TARGET && $AR rcsT $TARGET $SOURCES',
+                     '[AR-builtin] $TARGET'),
+    'archive': ('.a', 'rm -f $TARGET && $AR rcs $TARGET $SOURCES',
+                '[AR-builtin] $TARGET'),
+}
+
+
+def path_digest(node):
+    """
+    @return digest of the node path that is stable across runs
+    """
+    return zlib.crc32(node.path.encode('utf-8')) & 0xffffffff
+
+
+def chunk_objects(objects, chunk_size):
+    """
+    Splits objects into chunks of chunk_size objects on average.
+
+    Chunk boundaries are derived from object paths, not from positions, so
+    adding or removing an object affects only the chunk where the object
+    belongs and the other chunks remain unchanged. The link order of the
+    objects is preserved.
+
+    @return list of chunks (lists of objects)
+    """
+    chunks = [[]]
+    for obj in objects:
+        chunks[-1].append(obj)
+        # chunks are limited to twice the average size
+        if path_digest(obj) % chunk_size == 0 or \
+           len(chunks[-1]) >= 2 * chunk_size:
+            chunks.append([])
+    return [c for c in chunks if c]
+
+
+def link_sources(target, source, env, for_signature):
+    """
+    Provides sources of the component program link where built-in archives
+    are wrapped by --whole-archive, so that all their members are linked
+    the same way as members of a partially linked built-in object.
+    """
+    # an empty prefix would glue the flags to the neighbouring arguments
+    prefix = env.subst('$LINKFLAGSPREFIX')
+    result = []
+    for s in source:
+        if getattr(s.attributes, 'pila_built_in_archive', False):
+            result.extend([prefix + '--whole-archive', s,
+                           prefix + '--no-whole-archive'])
+        else:
+            result.append(s)
+    return result
+
+
+def add_config_dependencies(env, objects, source, combined=False):
+    """
+    Makes objects depend on the configuration used by their sources
+
+    @param combined - all sources are compiled into each of the objects
+    (unity translation unit), otherwise each object has its own source
+    """
+    if not env['ENABLE_CONFIG_SYMBOL_DEPS']:
+        # Every object depends on the configuration header that is
+        # being injected via imacro (See configuration.LoadConfig)
+        env.Depends(objects, env.subst('#$VARIANT_DIR/$CONFIG_HEADER'))
+    elif combined:
+        pila.configdeps.add_object_config_dependencies(env, objects, source)
+    else:
+        pila.configdeps.add_config_dependencies(env, objects, source)
+
+
+def FeatureObject(env, target=None, source=None, is_enabled=True, *args,
+                  **kw):
     """
     Wrapper for the standard static object build that provides the
     object only if requested. This Pseudo builder is useful when
     preparing conditionally compiled components based on external
     configuration.
+
+    In unity build mode (see unity module), C sources are compiled
+    as part of unity translation units when the built-in object is
+    declared and no object is provided.
+
+    Keyword argument opt_profile optionally names the optimization profile
+    of the object (see $OPT_PROFILES), it overrides profile of the project.
     """
     feature_object = None
+    opt_profile = kw.pop('opt_profile', None)
+    if opt_profile:
+        kw['PILA_OPT_PROFILE'] = opt_profile
 
-    if not source:
+    source_from_target = not source
+    if source_from_target:
         source = target[:]
 
+    # sources that compile into empty objects in the current
+    # configuration are skipped
+    if is_enabled and env['ENABLE_DEAD_UNIT_ELIMINATION']:
+        if target is None or source_from_target:
+            source = pila.deadunits.live_sources(env, source)
+            if source_from_target:
+                target = source[:]
+            is_enabled = bool(source)
+        elif pila.deadunits.is_dead(env, source):
+            # explicit targets correspond to the sources, the object is
+            # either built as a whole or skipped
+            is_enabled = False
+
     if is_enabled:
-        feature_object = env.Object(target, source, *args, **kw)
-        # Every object depends on the configuration header that is
-        # being injected via imacro (See configuration.LoadConfig)
-        env.Depends(feature_object, env.subst('#$VARIANT_DIR/$CONFIG_HEADER'))
-        env.Append(PILA_OBJECTS=feature_object)
+        object_pool = env.get('PILA_OBJECT_POOL')
+        unity_sources = None
+        if env['ENABLE_UNITY_BUILD']:
+            unity_sources = pila.unity.unity_sources(env, target, source,
+                                                     args, kw)
+        if unity_sources is not None:
+            pila.unity.register(env, unity_sources)
+        elif object_pool is not None and target is None and not args:
+            # multi-variant build, objects may be shared among variants,
+            # the pool takes care of their configuration dependencies
+            feature_object = object_pool.Object(env, source, **kw)
+        else:
+            feature_object = env.Object(target, source, *args, **kw)
+            add_config_dependencies(env, feature_object, source)
+        if feature_object is not None:
+            pila.pch.add_dependencies(env, feature_object)
+            pila.registry.register(env, 'PILA_OBJECTS', feature_object)
         pila.events.dispatcher.register_feature_object(env, target, source,
                                                        *args, **kw)
 
@@ -58,19 +185,65 @@ def FeatureSConscript(env, is_enabled=True, *args, **kw):
     return result
 
 
-def BuiltInObject(env, target_env, built_in_name='built-in.o'):
+def BuiltInObject(env, target_env, built_in_name=None, strategy=None,
+                  chunk_size=None):
     """
     @param target_env - target environment where the resulting
     built-in object is to be registered
     @param built_in_name - allows overriding the standard object name if
     there are e.g. 2 objects from 2 environment in the same output directory
-    being created.
+    being created. The standard name is built-in.o for partially linked
+    objects and built-in.a for archives.
+    @param strategy - form of the built-in object: 'ld' (partially linked
+    object), 'thin-archive' or 'archive', defaults to $BUILT_IN_STRATEGY.
+    LTO objects are not partially linked, thin archive is used instead.
+    @param chunk_size - when there are more feature objects, they are
+    partially linked in chunks of chunk_size objects on average that can be
+    linked in parallel. The built-in object is then composed from the
+    chunks. Defaults to $BUILT_IN_CHUNK_SIZE, 0 disables chunking.
+
+    In unity build mode, C sources of the feature objects are first
+    grouped into unity translation units of $UNITY_GROUP_SIZE sources on
+    average.
     """
-    ld_action = pila.verbosity.Action('$LINK -r -o $TARGET $SOURCES',
-                                      '[LD-builtin] $TARGET')
-    cmd = env.Command(built_in_name, env['PILA_OBJECTS'], \
-                             action=ld_action)
-    target_env.Append(PILA_BUILTINS=cmd)
+    if strategy is None:
+        strategy = env['BUILT_IN_STRATEGY']
+    if strategy not in built_in_strategies:
+        raise SCons.Errors.StopError(
+            BuiltInStrategyWarning,
+            'Unknown built-in object strategy: {}, supported strategies: '
+            '{}'.format(strategy, ', '.join(sorted(built_in_strategies))))
+    if strategy == 'ld' and env['ENABLE_LTO']:
+        strategy = 'thin-archive'
+    suffix, command, message = built_in_strategies[strategy]
+    if built_in_name is None:
+        built_in_name = 'built-in' + suffix
+    if chunk_size is None:
+        chunk_size = env['BUILT_IN_CHUNK_SIZE']
+    unity_sources = pila.unity.registered(env)
+    if unity_sources:
+        for unity_source, group in pila.unity.UnityGroups(
+                env, built_in_name, unity_sources, env['UNITY_GROUP_SIZE']):
+            unity_object = env.Object(unity_source)
+            # the included sources are not found by the scanner
+            env.Depends(unity_object, group)
+            add_config_dependencies(env, unity_object, group, combined=True)
+            pila.pch.add_dependencies(env, unity_object)
+            pila.registry.register(env, 'PILA_OBJECTS', unity_object)
+    objects = env.Flatten(pila.registry.registered(env, 'PILA_OBJECTS'))
+    if chunk_size and len(objects) > chunk_size and not env['ENABLE_LTO']:
+        part_action = pila.verbosity.Action(built_in_strategies['ld'][1],
+                                            '[LD-builtin-part] $TARGET')
+        objects = [env.Command('{}.part-{:08x}.o'.format(built_in_name,
+                                                         path_digest(c[0])),
+                               c, action=part_action)[0]
+                   for c in chunk_objects(objects, chunk_size)]
+    action = pila.verbosity.Action(command, message)
+    cmd = env.Command(built_in_name, objects, action=action)
+    if strategy != 'ld' and env['BUILT_IN_WHOLE_ARCHIVE']:
+        for node in cmd:
+            node.attributes.pila_built_in_archive = True
+    pila.registry.register(target_env, 'PILA_BUILTINS', cmd)
     pila.events.dispatcher.register_built_in_object(env, target_env,
                                                     built_in_name=built_in_name)
 
@@ -80,16 +253,40 @@ def ComponentProgram(env, target, *args, **kw):
     Provides a program linked from all built-ins in the specified
     environment. A side effect is a map file
     @param target - where the resulting program is to be stored
+
+    Keyword argument hot_code_profile optionally specifies function
+    hotness profile, defaults to $HOT_CODE_PROFILE. The hottest functions
+    are listed in a linker script fragment <target>.hot-code.ld (see
+    hotcode module) that is available to the linker script via INCLUDE.
     """
     map_file = env.File('%s.map' % target)
+    built_ins = pila.registry.registered(env, 'PILA_BUILTINS')
+    linkflags = ['$LINKFLAGS', '-Map=%s' % map_file.path]
+    hot_code_profile = kw.pop('hot_code_profile', None)
+    if hot_code_profile is None:
+        hot_code_profile = env.subst('$HOT_CODE_PROFILE')
+    hot_code = None
+    if hot_code_profile:
+        hot_code = pila.hotcode.HotCodeFragment(env, target, hot_code_profile,
+                                                env.Flatten(built_ins))
+        # the search path has to precede linker scripts in $LINKFLAGS
+        linkflags.insert(0, '-L%s' % hot_code.dir.path)
+    overrides = {}
+    if [b for b in env.Flatten(built_ins)
+            if getattr(b.attributes, 'pila_built_in_archive', False)]:
+        overrides['LINKCOM'] = env['LINKCOM'].replace('$SOURCES',
+                                                      '$_PILA_LINK_SOURCES')
+    overrides.update(kw)
 
     # Create the program and register the map file as a side effect,
     # so that the build system is able to track it
-    prog = env.Program(target, env['PILA_BUILTINS'],
-                       LINKFLAGS=['$LINKFLAGS', '-Map=%s' % map_file.path],
-                       *args, **kw)
+    prog = env.Program(target, built_ins, LINKFLAGS=linkflags,
+                       *args, **overrides)
 
     env.SideEffect(map_file, prog)
+    if hot_code is not None:
+        # the fragment is included by the linker script
+        env.Depends(prog, hot_code)
     pila.events.dispatcher.register_component_program(env, target, *args, **kw)
 
     return prog
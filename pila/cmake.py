@@ -17,13 +17,19 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 import os
+import re
+import pila.output
+import pila.registry
 import pila.verbosity
 
 class CMakeGen(object):
     """CMake generator
 
+    Every built-in object becomes a CMake OBJECT library with compiler
+    settings of its own environment. The executable is linked from
+    objects of all the libraries.
     """
-    cmake_src_var = 'SOURCES'
+    snippet_suffix = '.CMakeLists.snippet'
     def __init__(self):
         self.cmake_snippet_action = \
             pila.verbosity.Action(self.create_cmake_snippet,
@@ -32,20 +38,38 @@ class CMakeGen(object):
             pila.verbosity.Action(self.compose_cmake,
                                   '[CMake compose] $TARGET')
 
+    @classmethod
+    def library_name(clz, built_in_path):
+        """
+        @return name of the CMake library for the built-in object
+        """
+        return re.sub(r'[^A-Za-z0-9_]', '_', built_in_path)
+
     def create_cmake_snippet(self, env, target, source):
         """
-        Creates cmake snippet that appends specified sources to CMake variable.
+        Creates cmake snippet that defines OBJECT library of the built-in object.
 
-        :param env:
+        :param env: carries the library settings (PILA_CMAKE_LIBRARY) that
+        have been resolved while reading SConscripts
         :param target:
-        :param source:
+        :param source: settings signature followed by the library sources
         :return:
         """
-        with open(str(target[0]), 'w') as snippet:
-            self.add_cmake_defs(snippet, env)
+        library = env['PILA_CMAKE_LIBRARY']
+        name = library['name']
+        with pila.output.GeneratedFile(str(target[0])) as snippet:
             self.render_statement(snippet,
-                                  'list(APPEND {}'.format(self.cmake_src_var),
-                                  source)
+                                  'add_library({} OBJECT'.format(name),
+                                  source[1:])
+            self.render_statement(snippet,
+                                  'target_compile_definitions({} PRIVATE'.
+                                  format(name), library['defines'])
+            self.render_statement(snippet,
+                                  'target_include_directories({} PRIVATE'.
+                                  format(name), library['includes'])
+            self.render_statement(snippet,
+                                  'target_compile_options({} PRIVATE'.
+                                  format(name), library['options'])
 
     @classmethod
     def render_statement(clz, output, statement, lines=[], quoted=False):
@@ -72,9 +96,28 @@ class CMakeGen(object):
         output.write(')\n')
 
     @classmethod
-    def add_cmake_defs(clz, output, env):
-        clz.render_statement(output, 'add_definitions(',
-                             env.subst(env['_CPPDEFFLAGS']).split())
+    def library_settings(clz, env, built_in_name):
+        """Resolves compiler settings of the environment for the CMake library
+
+        :return: dictionary with library name, definitions, include
+        directories and compiler options
+        """
+        includes = []
+        for d in env.Flatten(env['CPPPATH']):
+            d = env.Dir(d)
+            # sources of variant directories without duplication reside in
+            # the source directory
+            for path in (d.path, d.srcnode().path):
+                if path not in includes:
+                    includes.append(path)
+
+        built_in = env.File(built_in_name)
+        return {
+            'name': clz.library_name(built_in.path),
+            'defines': env.subst('$_CPPDEFFLAGS').split(),
+            'includes': includes,
+            'options': env.subst('$CFLAGS $CCFLAGS', target=built_in).split(),
+        }
 
     def compose_cmake(self, env, target, source):
         """Compose cmake file from all source snippets
@@ -87,7 +130,7 @@ class CMakeGen(object):
         :param target: output file where the resulting CMake is to bo stored
         :param source: list of cmake snippets to be merged
         """
-        with open(str(target[0]), 'w') as cmake:
+        with pila.output.GeneratedFile(str(target[0])) as cmake:
             self.render_statement(cmake, 'cmake_minimum_required(VERSION',
                                   ['3.5'])
             self.render_statement(cmake, 'set(CMAKE_C_COMPILER',
@@ -99,25 +142,21 @@ class CMakeGen(object):
                                                   '$_LIBDIRFLAGS']),
                                   quoted=True
                                   )
-            self.render_statement(cmake, 'include_directories(',
-                                  map(env.Dir, env['CPPPATH']))
-            self.render_statement(cmake, 'set(CMAKE_C_FLAGS',
-                                  map(env.subst, env.Flatten(env['CCFLAGS'])),
-                                  quoted=True)
-            self.add_cmake_defs(cmake, env)
+            libraries = []
             for s in source[1:]:
                 with open(str(s)) as snippet:
                     cmake.write(snippet.read())
+                libraries.append(self.library_name(
+                    s.path[:-len(self.snippet_suffix)]))
 
-            # finally append the executable that consists of all the
-            # previously defined sources. Use basename of the executable to
-            # prevent warning reported by CMake
+            # finally append the executable that consists of objects of all
+            # the previously defined libraries. Use basename of the
+            # executable to prevent warning reported by CMake
             executable = os.path.basename(str(source[0]))
             self.render_statement(cmake, 'add_executable(',
-                                  [
-                                      executable,
-                                      '${%s}' % self.cmake_src_var,
-                                  ])
+                                  [executable] +
+                                  ['$<TARGET_OBJECTS:{}>'.format(l)
+                                   for l in libraries])
             self.render_statement(cmake, 'target_link_libraries(',
                                   [executable] + env.subst('$LIBS').split())
 
@@ -133,8 +172,8 @@ class CMakeGen(object):
         # We have to wrap all sources into an explicit 'File' object since we
         # don't create a CMake snippet until a built-in object is declared.
         # If we didn't wrap it here, the path would not be correct.
-        sources = map(env.File, env.Flatten(source))
-        env.Append(PILA_CMAKE_SRC=sources)
+        sources = [env.File(s) for s in env.Flatten(source)]
+        pila.registry.register(env, 'PILA_CMAKE_SRC', sources)
 
     def register_built_in_object(self, env, target_env, built_in_name, *args,
                                  **kw):
@@ -144,7 +183,9 @@ class CMakeGen(object):
         SConscript.
 
         The method will instantiate a command to create a CMake snippet that
-        covers all sources that have been used to compose the built-in object.
+        defines an OBJECT library from all sources that have been used to
+        compose the built-in object. Compiler settings of the library are
+        resolved right away and the snippet depends on them.
 
         :param env: environment where the feature object is to be built
         :param target_env: target environment where the resulting cmake snippet
@@ -154,11 +195,18 @@ class CMakeGen(object):
         :param kw:
         """
         if 'PILA_CMAKE_SRC' in env:
-            snippet_name = '{}.CMakeLists.snippet'.format(built_in_name)
+            library = self.library_settings(env, built_in_name)
+            snippet_name = '{}{}'.format(built_in_name, self.snippet_suffix)
             cmake_snippet = env.Command(snippet_name,
-                                        env['PILA_CMAKE_SRC'],
-                                        action=self.cmake_snippet_action)
-            target_env.Append(PILA_CMAKE_SNIPPET=cmake_snippet)
+                                        [env.Value(repr(sorted(
+                                            library.items())))] +
+                                        pila.registry.registered(
+                                            env, 'PILA_CMAKE_SRC'),
+                                        action=self.cmake_snippet_action,
+                                        PILA_CMAKE_LIBRARY=library)
+            env.Precious(cmake_snippet)
+            pila.registry.register(target_env, 'PILA_CMAKE_SNIPPET',
+                                   cmake_snippet)
 
     def register_component_program(self, env, target, *args, **kw):
         """
@@ -174,8 +222,10 @@ class CMakeGen(object):
         if 'PILA_CMAKE_SNIPPET' in env:
             # target is passed as the first source
             cmake = env.Command('%s.CMakeLists.txt' % target,
-                                [target] + env['PILA_CMAKE_SNIPPET'],
+                                [target] + pila.registry.registered(
+                                    env, 'PILA_CMAKE_SNIPPET'),
                                 action=self.cmake_action)
+            env.Precious(cmake)
         else:
             print('Warning: no CMake snippets for {}, this probably means '
                   'that no built-in object has been declared'.format(target))
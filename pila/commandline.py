@@ -0,0 +1,98 @@
+"""command lines of build targets
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Generators of foreign build descriptions need exactly the same command
+lines that scons would spawn for the targets.
+"""
+import SCons.Action
+import SCons.Errors
+import SCons.Subst
+import SCons.Warnings
+
+# construction variables that determine command lines of pila targets,
+# the precompiled header is injected only into command lines of C sources
+command_vars = '$CCCOM $CXXCOM $ASPPCOM $ASCOM $LINKCOM $PILA_PCH_HEADER'
+
+
+class CommandLineWarning(SCons.Warnings.Warning):
+    pass
+
+
+def expand_action(action, targets, sources, env, executor):
+    """
+    @return list of command line strings of the action
+    """
+    result = []
+    if isinstance(action, SCons.Action.ListAction):
+        for a in action.list:
+            result.extend(expand_action(a, targets, sources, env, executor))
+    elif isinstance(action, SCons.Action.CommandGeneratorAction):
+        result.extend(expand_action(action._generate(targets, sources, env, 0,
+                                                     executor),
+                                    targets, sources, env, executor))
+    elif isinstance(action, SCons.Action.CommandAction):
+        escape = env.get('ESCAPE', lambda x: x)
+        cmd_list, ignore, silent = action.process(targets, sources, env,
+                                                  executor)
+        for cmd_line in filter(len, cmd_list):
+            result.append(' '.join(SCons.Subst.escape_list(cmd_line,
+                                                           escape)))
+    else:
+        raise SCons.Errors.StopError(CommandLineWarning,
+                                     'Action of {} is not a command: {}'.
+                                     format(targets[0], action))
+    return result
+
+
+def keep_command_lines(nodes):
+    """Prevents scons from releasing executors of the nodes after they
+    have been built, command lines of such nodes would not be available
+    """
+    for node in nodes:
+        node.attributes.keep_targetinfo = 1
+
+
+def command_lines(node, **overrides):
+    """Provides command lines that build the node
+
+    @param node - target node that has a builder, see keep_command_lines()
+    @param overrides - construction variables that override the build
+    environment of the node
+    @return list of command line strings
+    """
+    executor = node.get_executor()
+    env = executor.get_build_env()
+    if overrides:
+        env = env.Override(overrides)
+    targets = executor.get_all_targets()
+    sources = executor.get_all_sources()
+    result = []
+    for action in executor.get_action_list():
+        result.extend(expand_action(action, targets, sources, env, executor))
+
+    return result
+
+
+def command_signature(env, target=None):
+    """
+    @param target - optional node, settings that depend on the target
+    location (e.g. optimization profile of the project) are resolved for
+    it
+    @return string that changes whenever command lines of targets built
+    in the environment may change
+    """
+    return env.subst(command_vars, target=target)
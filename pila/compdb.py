@@ -0,0 +1,147 @@
+"""compilation database generator module
+
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import json
+import pila.commandline
+import pila.output
+import pila.registry
+import pila.verbosity
+
+
+class CompileCommandsGen(object):
+    """compile_commands.json generator
+
+    Entries of all feature objects of a built-in object are stored in a
+    fragment. The fragments are concatenated into the compilation
+    database of each component program, so fragments of unchanged
+    built-in objects are neither regenerated nor parsed.
+    """
+    def __init__(self):
+        self.fragment_action = \
+            pila.verbosity.Action(self.create_fragment,
+                                  '[compile_commands fragment] $TARGET')
+        self.compose_action = \
+            pila.verbosity.Action(self.compose_compile_commands,
+                                  '[compile_commands compose] $TARGET')
+
+    def create_fragment(self, env, target, source):
+        """
+        Creates comma separated compilation database entries for all
+        feature objects of a built-in object.
+
+        :param env: environment that carries the objects
+        (PILA_COMPDB_OBJECTS)
+        :param target: fragment file
+        :param source: sources of the objects (unused)
+        """
+        directory = env.Dir('#').abspath
+        entries = []
+        for obj in env['PILA_COMPDB_OBJECTS']:
+            # the compiler is not to be run through the object cache
+            command = ' && '.join(
+                pila.commandline.command_lines(obj, OBJCACHE_PREFIX=''))
+            for s in obj.sources:
+                entries.append(json.dumps({
+                    'directory': directory,
+                    'command': command.strip(),
+                    'file': s.abspath if s.has_builder() else
+                    s.srcnode().abspath,
+                    'output': obj.abspath,
+                }, indent=2, sort_keys=True))
+        with pila.output.GeneratedFile(str(target[0])) as fragment:
+            fragment.write(',\n'.join(entries))
+
+    def compose_compile_commands(self, env, target, source):
+        """Concatenates all fragments into the compilation database
+
+        :param env: unused
+        :param target: the compilation database
+        :param source: fragments
+        """
+        fragments = []
+        for s in source:
+            with open(str(s)) as fragment:
+                content = fragment.read()
+            if content:
+                fragments.append(content)
+        with pila.output.GeneratedFile(str(target[0])) as compile_commands:
+            compile_commands.write('[\n{}\n]\n'.format(',\n'.join(fragments)))
+
+    def register_feature_object(self, env, target, source, *args, **kw):
+        """Notes builder overrides of the feature object, so that the
+        fragment is regenerated when they change
+
+        :param env:
+        :param target: unused
+        :param source: unused
+        :param args: unused
+        :param kw: builder overrides of the object
+        """
+        if kw:
+            pila.registry.register(env, 'PILA_COMPDB_OVERRIDES',
+                                   repr(sorted(kw.items())))
+
+    def register_built_in_object(self, env, target_env, built_in_name, *args,
+                                 **kw):
+        """Generates a compilation database fragment for the built-in object.
+
+        The fragment depends on the sources and on a signature of the
+        compiler command lines.
+
+        :param env: environment where the feature objects have been built
+        :param target_env: target environment where the resulting fragment
+        needs to be registered
+        :param built_in_name: see BuiltInObject
+        :param args: unused
+        :param kw: unused
+        """
+        objects = pila.registry.registered(env, 'PILA_OBJECTS')
+        pila.commandline.keep_command_lines(objects)
+        signature = env.Value('\n'.join(
+            [pila.commandline.command_signature(env,
+                                                env.File(built_in_name))] +
+            pila.registry.registered(env, 'PILA_COMPDB_OVERRIDES')))
+        sources = [s for obj in objects for s in obj.sources]
+        fragment_name = '{}.compile_commands.fragment'.format(built_in_name)
+        fragment = env.Command(fragment_name, [signature] + sources,
+                               action=self.fragment_action,
+                               PILA_COMPDB_OBJECTS=objects)
+        env.Precious(fragment)
+        pila.registry.register(target_env, 'PILA_COMPDB_FRAGMENT', fragment)
+
+    def register_component_program(self, env, target, *args, **kw):
+        """
+        Generates compile_commands.json in the directory of the component
+        program.
+
+        :param env: environment where the database is to be built
+        :param target: component program
+        :param args: unused
+        :param kw: unused
+        """
+        if 'PILA_COMPDB_FRAGMENT' in env:
+            program = env.File(env.Flatten(target)[0])
+            compile_commands = env.Command(
+                program.dir.File('compile_commands.json'),
+                pila.registry.registered(env, 'PILA_COMPDB_FRAGMENT'),
+                action=self.compose_action)
+            env.Precious(compile_commands)
+        else:
+            print('Warning: no compilation database fragments for {}, this '
+                  'probably means that no built-in object has been '
+                  'declared'.format(target))
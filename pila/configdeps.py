@@ -0,0 +1,219 @@
+"""per-symbol configuration dependencies
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+The idea has been borrowed from fixdep tool of the Linux kernel. Each
+configuration symbol has its own stamp file that changes only when the
+value of the symbol changes. Every feature object then depends only on
+stamps of symbols that are referenced by its sources and their includes
+instead of depending on the complete configuration header.
+"""
+import SCons.Util
+import io
+import os
+import re
+import pila.output
+
+config_symbol_re = re.compile(r'\bCONFIG_(\w+)')
+include_re = re.compile(r'^[ \t]*#[ \t]*include[ \t]*["<]([^">]+)[">]',
+                        re.MULTILINE)
+
+
+def config_symbols(config):
+    """
+    @return dictionary of all symbols (without the CONFIG_ prefix) and
+    their values provided by the configuration object
+    """
+    symbols = getattr(config, 'symbols', None)
+    if callable(symbols):
+        return symbols()
+
+    return vars(config)
+
+
+def stamp_path(env, symbol):
+    return env.File('#$VARIANT_DIR/$CONFIG_STAMP_DIR/%s' % symbol)
+
+
+def write_stamps(stamps, values):
+    """Writes stamp files for all specified stamp targets.
+
+    A stamp is rewritten only when the value of its symbol has changed,
+    so that its signature remains the same for unaffected objects.
+
+    @param stamps - stamp file targets, the file name is the symbol name
+    @param values - dictionary of symbol values as found in .config
+    """
+    for stamp in stamps:
+        path = str(stamp)
+        symbol = 'CONFIG_' + os.path.basename(path)
+        pila.output.write_if_changed(path, '%s\n' % values.get(symbol, 'n'))
+
+
+class SymbolScanner(object):
+    """Collects configuration symbols referenced by a source file and
+    all its includes.
+
+    Results for each file are cached, so that headers shared by many
+    translation units are read only once.
+    """
+    def __init__(self):
+        self.cache = {}
+        self.include_cache = {}
+
+    def scan_file(self, path):
+        """
+        @return tuple (symbols, includes) for a single file or None when
+        the file doesn't exist
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_mtime, st.st_size)
+        entry = self.cache.get(path)
+        if entry is None or entry[0] != key:
+            with io.open(path, 'r', encoding='latin-1') as source_file:
+                content = source_file.read()
+            entry = (key,
+                     frozenset(config_symbol_re.findall(content)),
+                     tuple(include_re.findall(content)))
+            self.cache[path] = entry
+
+        return entry[1:]
+
+    def find_include(self, include, search_path):
+        key = (include, search_path)
+        if key not in self.include_cache:
+            found = None
+            for d in search_path:
+                candidate = os.path.join(d, include)
+                if os.path.isfile(candidate):
+                    found = os.path.normpath(candidate)
+                    break
+            self.include_cache[key] = found
+
+        return self.include_cache[key]
+
+    def scan(self, path, search_path, ignored=()):
+        """Scans a source file and recursively all includes that can be
+        found in the search path.
+
+        Includes that cannot be found (e.g. system headers) are skipped.
+
+        @param path - absolute path of the source file
+        @param search_path - tuple of include directories
+        @param ignored - names of includes that are not scanned
+        @return set of referenced symbols or None when the source doesn't
+        exist yet (e.g. it is generated during the build)
+        """
+        if self.scan_file(path) is None:
+            return None
+        symbols = set()
+        visited = set()
+        pending = [path]
+        while pending:
+            current = pending.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            result = self.scan_file(current)
+            if result is None:
+                continue
+            file_symbols, includes = result
+            symbols.update(file_symbols)
+            local_path = (os.path.dirname(current),) + search_path
+            for include in includes:
+                if include in ignored:
+                    continue
+                found = self.find_include(include, local_path)
+                if found is not None:
+                    pending.append(found)
+
+        return symbols
+
+
+scanner = SymbolScanner()
+
+
+def include_search_path(env):
+    """
+    @return tuple of absolute include directories of the environment,
+    both the source and the variant directory of each entry are provided
+    """
+    search_path = []
+    for p in env.Flatten(env.get('CPPPATH', [])):
+        if SCons.Util.is_String(p):
+            p = env.Dir(env.subst(p))
+        for d in (p.srcnode().abspath, p.abspath):
+            if d not in search_path:
+                search_path.append(d)
+
+    return tuple(search_path)
+
+
+def add_config_dependencies(env, objects, source):
+    """Makes each object depend on stamps of configuration symbols used
+    by its own source (see add_object_config_dependencies).
+
+    @param objects - feature object nodes, one per source
+    @param source - sources of the objects
+    """
+    objects = env.Flatten(objects)
+    sources = env.Flatten(source)
+    if len(objects) != len(sources):
+        # objects cannot be paired with their sources
+        add_object_config_dependencies(env, objects, sources)
+        return
+    for obj, s in zip(objects, sources):
+        add_object_config_dependencies(env, obj, s)
+
+
+def add_object_config_dependencies(env, objects, source):
+    """Makes objects depend on stamps of configuration symbols used by
+    any of the sources, i.e. all sources contribute to each of the
+    objects (e.g. a unity translation unit).
+
+    The configuration header is still required to exist before
+    compilation, however, it is not a real dependency. When a source
+    references a symbol that is not part of the current configuration or
+    the source cannot be scanned, the objects fall back to depending on
+    the complete configuration header.
+
+    @param objects - object nodes
+    @param source - sources compiled into each of the objects
+    """
+    config_header = env.File('#$VARIANT_DIR/$CONFIG_HEADER')
+    known_symbols = config_symbols(env['CONFIG'])
+    search_path = include_search_path(env)
+    # the configuration header lists all symbols, moreover, it doesn't
+    # exist before the first build
+    ignored = (env.subst('$CONFIG_HEADER'),)
+    symbols = set()
+    fallback = False
+    for s in env.Flatten(source):
+        source_symbols = scanner.scan(env.File(s).srcnode().abspath,
+                                      search_path, ignored)
+        if source_symbols is None:
+            fallback = True
+        else:
+            symbols.update(source_symbols)
+
+    env.Requires(objects, config_header)
+    if fallback or not symbols.issubset(known_symbols):
+        env.Depends(objects, config_header)
+    env.Depends(objects, [stamp_path(env, s)
+                          for s in sorted(symbols.intersection(known_symbols))])
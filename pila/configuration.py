@@ -17,8 +17,14 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 import SCons.Warnings
 import SCons.Script
-import importlib
+import pila.configdeps
 import pila.genconfig
+import pila.graph
+import pila.kconfig
+import pila.lto
+import pila.output
+import pila.snapshot
+import pila.variants
 import pila.verbosity
 import os
 
@@ -32,22 +38,54 @@ class ConfigNotFound(ToolPilaConfigWarning):
 SCons.Warnings.enableWarningClass(ToolPilaConfigWarning)
 
 
+dot_config_cache = {}
+
+
+def load_dot_config(path):
+    """Parses the specified .config.
+
+    The parsed table is cached, so that all configuration targets
+    generated during a build share a single parse.
+
+    @return pila.genconfig.ConfigTable
+    """
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size)
+    entry = dot_config_cache.get(path)
+    if entry is None or entry[0] != key:
+        with open(path, 'r') as dot_file:
+            entry = (key, pila.genconfig.parse_dot_config(dot_file))
+        dot_config_cache[path] = entry
+
+    return entry[1]
+
+
 def create_config_header(env, target, source):
-    with open(str(target[0]), 'w') as config_header:
-        generator = pila.genconfig.CHeaderConfigGenerator(config_header)
-        with open(str(source[0]), 'r') as dot_file:
-            pila.genconfig.process_dot_config(dot_file, generator)
+    """Creates the configuration header.
+
+    Any additional targets are configuration symbol stamps (see
+    configdeps module)
+    """
+    table = load_dot_config(str(source[0]))
+    with pila.output.GeneratedFile(str(target[0])) as config_header:
+        table.generate(pila.genconfig.CHeaderConfigGenerator(config_header))
+
+    pila.configdeps.write_stamps(target[1:], table.symbols)
 
 
 def create_config_py(env, target, source):
-    with open(str(target[0]), 'w') as config_py:
-        generator = pila.genconfig.PythonConfigGenerator(config_py)
-        with open(str(source[0]), 'r') as dot_file:
-            pila.genconfig.process_dot_config(dot_file, generator)
+    table = load_dot_config(str(source[0]))
+    with pila.output.GeneratedFile(str(target[0])) as config_py:
+        table.generate(pila.genconfig.PythonConfigGenerator(config_py))
 
 
 def import_config_module(env):
-    """Imports configuration module if it exists.
+    """Imports configuration if it exists.
+
+    The configuration is loaded from the configuration snapshot
+    ($CONFIG_SNAPSHOT) that is refreshed from $DOT_CONFIG only when
+    needed. This is equivalent to importing the configuration module,
+    however, null builds don't pay for parsing and importing it.
 
     The configuration is made available through the environment. The
     CFLAGS are extended with macro definitions from generated
@@ -60,24 +98,39 @@ def import_config_module(env):
     """
     config_imported = True
     try:
-        config_module_name = env.subst('$CONFIG_MODULE_NAME')
-        config = importlib.import_module(config_module_name)
+        config = pila.snapshot.load_config(env.subst('$DOT_CONFIG'),
+                                           env.subst('$CONFIG_SNAPSHOT'))
         # export the loaded configuration via this environment
-        env.Append(CONFIG = config.Config())
-    except ImportError as e:
+        env.Append(CONFIG = config)
+    except IOError as e:
         config_imported = False
-        print("Config python module %s doesn't exist" % config_module_name)
+        print("Configuration %s cannot be loaded: %s" %
+              (env.subst('$DOT_CONFIG'), e))
     else:
-        env.Append(CCFLAGS = ['-imacros', '$CONFIG_HEADER', ])
+        # The configuration is injected via -imacros or via the
+        # precompiled header (see pch.config_flags)
+        env.Append(CCFLAGS = ['$_PILA_CONFIG_FLAGS', ])
         # Configuration header is generated into the top level build
         # directory. Therefore, we specify a search path for it.
         env.Append(CPPPATH = '#$VARIANT_DIR')
 
-        env.Command(os.path.join('$VARIANT_DIR', '$CONFIG_HEADER'),
-                    '$DOT_CONFIG',
-                    action=pila.verbosity.Action(create_config_header,
-                                                 'Creating configuration ' \
-                                                 'header: $TARGET'))
+        config_targets = [os.path.join('$VARIANT_DIR', '$CONFIG_HEADER')]
+        # Each configuration symbol gets its stamp so that feature
+        # objects may depend only on symbols they really use
+        if env['ENABLE_CONFIG_SYMBOL_DEPS']:
+            stamps = [pila.configdeps.stamp_path(env, symbol) for symbol in
+                      pila.configdeps.config_symbols(env['CONFIG'])]
+            config_targets.extend(stamps)
+
+        config_header = env.Command(config_targets,
+                                    '$DOT_CONFIG',
+                                    action=pila.verbosity.Action(
+                                        create_config_header,
+                                        'Creating configuration header: ' \
+                                        '$TARGET'))
+        # Generated files are rewritten only when their content changes,
+        # therefore, scons must not remove them before rebuilding
+        env.Precious(config_header)
 
     return config_imported
 
@@ -124,21 +177,34 @@ def generate(env):
                            help="Search path for the binary, default is to " \
                            "search system path")
 
-    kconfig_frontend_prog = find_program(env, 'kconfig-{}'.
-                                         format(
-                                             SCons.Script.GetOption('kconfig_frontend')),
-                                         path=SCons.Script.GetOption('kconfig_frontend_bin_path'))
-    if kconfig_frontend_prog is None:
-        raise SCons.Errors.StopError(
-            ToolPilaConfigWarning,
-            'Kconfig frontend ({}) not found'.
-            format(SCons.Script.GetOption('kconfig_frontend')))
 
-    env.Append(PILA_KCONFIG_FRONTEND=kconfig_frontend_prog)
+def find_kconfig_frontend(env):
+    """Looks up the kconfig frontend binary.
+
+    The lookup is deferred until the frontend is really needed, so that
+    regular builds don't probe the file system for it.
+    """
+    if 'PILA_KCONFIG_FRONTEND' not in env:
+        kconfig_frontend_prog = find_program(env, 'kconfig-{}'.
+                                             format(
+                                                 SCons.Script.GetOption('kconfig_frontend')),
+                                             path=SCons.Script.GetOption('kconfig_frontend_bin_path'))
+        if kconfig_frontend_prog is None:
+            raise SCons.Errors.StopError(
+                ToolPilaConfigWarning,
+                'Kconfig frontend ({}) not found'.
+                format(SCons.Script.GetOption('kconfig_frontend')))
+
+        env.Append(PILA_KCONFIG_FRONTEND=kconfig_frontend_prog)
 
 
 def create_dot_config_target(env):
-    dot_config_action = pila.verbosity.Action('DISPLAY=%s KCONFIG_CONFIG=`pwd`/$TARGET $PILA_KCONFIG_FRONTEND $SOURCES' % (os.environ['DISPLAY']),
+    find_kconfig_frontend(env)
+    # Graphical frontends need the display, text based frontends may
+    # run without it (e.g. in CI)
+    display = os.environ.get('DISPLAY')
+    display_setting = 'DISPLAY=%s ' % display if display else ''
+    dot_config_action = pila.verbosity.Action('%sKCONFIG_CONFIG=`pwd`/$TARGET $PILA_KCONFIG_FRONTEND $SOURCES' % display_setting,
                                               'Running config')
     dot_config = env.Command('$DOT_CONFIG', '$TOPLEVEL_KCONFIG', action=dot_config_action)
     env.AlwaysBuild(dot_config)
@@ -150,15 +216,118 @@ def create_dot_config_target(env):
     env.Precious(dot_config)
 
 
-def LoadBuildEnv(env, setup_build_env):
+def kconfig_operation_action(operation):
+    """Creates an action that runs native kconfig operation in-process.
+
+    @param operation - one of pila.kconfig.operations
+    """
+    def run_kconfig_operation(env, target, source):
+        try:
+            kconfig = pila.kconfig.load_kconfig(str(source[0]),
+                                                env.subst('$KCONFIG_CACHE'))
+            with pila.output.GeneratedFile(str(target[0])) as out_file:
+                pila.kconfig.operations[operation](kconfig,
+                                                   env.subst('$DOT_CONFIG'),
+                                                   out_file)
+        except pila.kconfig.KconfigError as e:
+            print('Kconfig error: %s' % e)
+            return 1
+
+    return pila.verbosity.Action(run_kconfig_operation,
+                                 '[%s] $TARGET' % operation)
+
+
+def create_kconfig_operation_target(env, operation, py_config):
+    """Provides a target for native (non-interactive) kconfig operation.
+
+    olddefconfig and alldefconfig regenerate $DOT_CONFIG (and the
+    configuration python module), savedefconfig stores minimal
+    configuration into $DEFCONFIG.
+    """
+    action = kconfig_operation_action(operation)
+    if operation == 'savedefconfig':
+        result = env.Command('$DEFCONFIG', ['$TOPLEVEL_KCONFIG', '$DOT_CONFIG'],
+                             action=action)
+    else:
+        result = env.Command('$DOT_CONFIG', '$TOPLEVEL_KCONFIG',
+                             action=action)
+        env.NoClean(result)
+        # The operation reads the existing configuration
+        env.Precious(result)
+        result = [result, py_config]
+    env.AlwaysBuild(result[0])
+    env.Alias(operation, result)
+
+
+def apply_config_settings(env):
+    """Applies settings provided by the imported configuration"""
+    # Configuration may specify cross tool chain prefix unless user
+    # has explicitely set it when loading the tool
+    if env['CROSS_COMPILE'] == '' and \
+       env['CONFIG'].CROSS_COMPILE is not False:
+        env['CROSS_COMPILE'] = env['CONFIG'].CROSS_COMPILE
+
+    pila.lto.apply_config_settings(env)
+    if env['ENABLE_LTO']:
+        pila.lto.setup(env)
+
+
+def load_variant_build_envs(env, setup_build_env, dot_configs):
+    """Sets up one build environment per configuration.
+
+    All variants share a pool of feature objects, so that objects with
+    identical compiler flags and configuration symbols they use are
+    compiled only once.
+
+    @param dot_configs - list of configuration files, each of them has
+    to result in a different $VARIANT_DIR
+    """
+    object_pool = pila.variants.ObjectPool()
+    variant_dirs = set()
+    for dot_config in dot_configs:
+        variant_env = env.Clone(DOT_CONFIG=dot_config,
+                                ENABLE_CONFIG_SYMBOL_DEPS=True,
+                                PILA_OBJECT_POOL=object_pool)
+        if not os.path.exists(dot_config) or \
+           not import_config_module(variant_env):
+            raise SCons.Errors.StopError(ConfigNotFound,
+                                         'Configuration {} not found'.
+                                         format(dot_config))
+        variant_dir = variant_env.subst('$VARIANT_DIR')
+        if variant_dir in variant_dirs:
+            raise SCons.Errors.StopError(ToolPilaConfigWarning,
+                                         'Configuration {} uses the same '
+                                         'variant directory as another '
+                                         'one: {}'.format(dot_config,
+                                                          variant_dir))
+        variant_dirs.add(variant_dir)
+        apply_config_settings(variant_env)
+        setup_build_env(variant_env)
+
+    object_pool.report()
+
+
+def LoadBuildEnv(env, setup_build_env, dot_configs=None):
     """Loads configuration python module and sets up build environment.
 
-    If the python configuration module doesn't exist, the build is
-    switched into special configuration mode where:
-    - config.py is generated from .config (if one exists)
-    - interactive configuration is launched if .config is not present
-      yet
+    If the python configuration module doesn't exist, it is generated
+    right away from .config (if one exists) and the build continues in
+    the same invocation.
+
+    If .config is not present yet, the build is switched into special
+    configuration mode where interactive configuration is launched.
+
+    When ENABLE_GRAPH_SNAPSHOT is set, setup_build_env is replaced by
+    replaying the recorded build graph (see graph module) as long as it
+    is up to date.
+
+    @param dot_configs - optional list of configuration files to be built
+    in a single run (multi-variant build), setup_build_env is called for
+    each of them. Configuration mode is not available in this case.
     """
+    if dot_configs:
+        load_variant_build_envs(env, setup_build_env, dot_configs)
+        return
 
 
     py_config_action = pila.verbosity.Action(create_config_py,
@@ -168,29 +337,38 @@ def LoadBuildEnv(env, setup_build_env):
                             '$DOT_CONFIG', action=py_config_action)
     env.Alias('conf', py_config)
     env.NoClean(py_config)
+    env.Precious(py_config)
 
+    kconfig_operations = [t for t in SCons.Script.COMMAND_LINE_TARGETS
+                          if t in pila.kconfig.operations]
     # Explicit configuration request -> make sure that .config gets rebuilt
     if 'conf' in SCons.Script.COMMAND_LINE_TARGETS:
         create_dot_config_target(env)
+    elif kconfig_operations:
+        for operation in kconfig_operations:
+            create_kconfig_operation_target(env, operation, py_config)
     else:
-        if os.path.exists(py_config[0].name) and \
-           os.path.exists(env.subst('$DOT_CONFIG')) and \
-           import_config_module(env):
-            # Configuration may specify cross tool chain prefix unless user
-            # has explicitely set it when loading the tool
-            if env['CROSS_COMPILE'] == '' and \
-               env['CONFIG'].CROSS_COMPILE is not False:
-                env['CROSS_COMPILE'] = env['CONFIG'].CROSS_COMPILE
-
-            setup_build_env(env)
+        dot_config_exists = os.path.exists(env.subst('$DOT_CONFIG'))
+        # Bootstrap the configuration module during reading of
+        # SConscripts, so that a clean checkout builds in one invocation
+        if dot_config_exists and not os.path.exists(py_config[0].name):
+            print('Creating configuration module: %s' % py_config[0])
+            create_config_py(env, py_config, [env.subst('$DOT_CONFIG')])
+
+        if dot_config_exists and import_config_module(env):
+            apply_config_settings(env)
+            if env['ENABLE_GRAPH_SNAPSHOT']:
+                pila.graph.setup_build_env(env, setup_build_env)
+            else:
+                setup_build_env(env)
         else:
             print('=' * 80)
-            print('Configuration python module is not present')
+            print('Configuration is not present')
             print('Switching to configuration build, please, rerun build')
             print('=' * 80)
             # If base configuration sources exists, set default rule
             # to only regenerate config python module
-            if os.path.exists(env.subst('$DOT_CONFIG')):
+            if dot_config_exists:
                 env.Default(py_config)
             else:
                 # Otherwise ensure interactive config tool is launched via the default target
@@ -0,0 +1,153 @@
+"""critical path analysis
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Durations of actions recorded by a traced build (see trace module) are
+combined with the hierarchy of feature objects -> built-in objects ->
+component programs. The report shows the longest chain of actions,
+parallelism available in each project and the theoretical minimum build
+time for the number of jobs the trace has been recorded with.
+"""
+import json
+import pila.events
+import pila.trace
+import pila.verbosity
+
+target_name = 'pila-critical-path'
+
+
+def load_trace(path):
+    """
+    @return tuple (durations, projects, jobs) where durations and
+    projects are dictionaries indexed by target
+    """
+    with open(path) as f:
+        trace = json.load(f)
+    durations = {}
+    projects = {}
+    for event in trace['traceEvents']:
+        if event.get('ph') == 'X':
+            durations[event['name']] = event['dur'] / 1e6
+            projects[event['name']] = event.get('args', {}).get('project')
+
+    return durations, projects, trace.get('otherData', {}).get('jobs', 1)
+
+
+class CriticalPath(pila.trace.Hierarchy):
+    """Longest chain of actions in the pila hierarchy"""
+    def __init__(self):
+        pila.trace.Hierarchy.__init__(self)
+        self.finish = {}
+        self.predecessor = {}
+
+    def schedule(self, target, inputs, durations):
+        """Calculates finish time of the target when all of its inputs
+        have finished and there are enough jobs
+        """
+        best = max(inputs, key=lambda i: self.finish[i]) if inputs else None
+        self.finish[target] = durations.get(target, 0) + \
+            (self.finish[best] if best is not None else 0)
+        self.predecessor[target] = best
+
+    def analyze(self, durations):
+        """
+        @return list of targets on the critical path, the first target
+        starts the path
+        """
+        for obj in self.objects:
+            self.schedule(obj, [], durations)
+        for part, objects in self.parts.items():
+            self.schedule(part, objects, durations)
+        for built_in, objects in self.built_ins.items():
+            self.schedule(built_in, objects, durations)
+        for program, built_ins in self.programs.items():
+            self.schedule(program, [b for b in built_ins if b in self.finish],
+                          durations)
+
+        path = []
+        target = max(self.finish, key=lambda t: self.finish[t]) \
+            if self.finish else None
+        while target is not None:
+            path.append(target)
+            target = self.predecessor[target]
+
+        return list(reversed(path))
+
+    def project_summary(self, durations, projects):
+        """
+        @return dictionary of (work, critical path) indexed by project
+        """
+        summary = {}
+        for built_in in self.built_ins:
+            project = projects.get(built_in)
+            work, critical_path = summary.get(project, (0, 0))
+            work += sum(durations.get(t, 0)
+                        for t in self.members(built_in) + [built_in])
+            summary[project] = (work, max(critical_path,
+                                          self.finish[built_in]))
+
+        return summary
+
+    def report(self, env, target, source):
+        trace_file = env.subst('$PILA_TRACE_FILE')
+        try:
+            durations, projects, jobs = load_trace(trace_file)
+        except (IOError, ValueError, KeyError) as e:
+            print('Cannot load build trace {}: {}, run a complete build with '
+                  'PILA_TRACE=1 first'.format(trace_file, e))
+            return 1
+
+        path = self.analyze(durations)
+        if not path:
+            print('No pila targets have been declared')
+            return 1
+        targets = self.objects.union(self.parts, self.built_ins,
+                                     self.programs)
+        missing = len([t for t in targets if t not in durations])
+        total_work = sum(durations.get(t, 0) for t in targets)
+        critical_path = self.finish[path[-1]]
+
+        print('critical path ({} jobs, trace: {}):'.format(jobs, trace_file))
+        for t in path:
+            print('  {:8.3f} s {:9} {}'.format(durations.get(t, 0),
+                                               self.kind(t), t))
+        print('critical path: {:.3f} s, total work: {:.3f} s, theoretical '
+              'minimum build time: {:.3f} s'.format(
+                  critical_path, total_work,
+                  max(critical_path, total_work / jobs)))
+        print('per project parallelism (work / critical path):')
+        summary = self.project_summary(durations, projects)
+        for project in sorted(summary, key=str):
+            work, project_path = summary[project]
+            parallelism = work / project_path if project_path else 0
+            print('  {:20} work {:8.3f} s, critical path {:8.3f} s, '
+                  'parallelism {:6.1f}{}'.format(
+                      str(project), work, project_path, parallelism,
+                      ' (less than jobs)' if parallelism < jobs else ''))
+        if missing:
+            print('Note: {} targets have not been built by the traced build, '
+                  'their duration is unknown'.format(missing))
+
+
+def setup(env):
+    """Provides the critical path report target"""
+    critical_path = CriticalPath()
+    pila.events.dispatcher.subscribe(critical_path)
+    report = env.Alias(target_name, [],
+                       pila.verbosity.Action(critical_path.report,
+                                             '[critical path] '
+                                             '$PILA_TRACE_FILE'))
+    env.AlwaysBuild(report)
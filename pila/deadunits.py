@@ -0,0 +1,371 @@
+"""dead translation unit elimination
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Sources whose whole body is wrapped in preprocessor conditionals that
+depend on disabled configuration symbols would compile into empty
+objects. When ENABLE_DEAD_UNIT_ELIMINATION is set, FeatureObject skips
+such sources, each source of the feature object is evaluated separately.
+
+Each source is scanned for its top level conditional blocks. Only
+#include, #define, #undef and #pragma may appear outside of them. A block
+is dead when conditions of all its branches are false and it has no
+#else branch. Conditions may consist of CONFIG_ symbols, defined(),
+integer literals and C operators, any other identifier makes the
+condition unknown and the source is compiled. So are sources without
+any conditional block (e.g. wrappers that include the implementation),
+sources that #define or #undef a CONFIG_ symbol and sources that include
+anything else than the configuration header before a conditional block,
+as the included file may define CONFIG_ symbols. Scan results are cached
+per content digest in $DEAD_UNITS_CACHE.
+"""
+import atexit
+import hashlib
+import os
+import re
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import pila.configdeps
+
+comment_re = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+directive_re = re.compile(r'^\s*#\s*(\w+)\s*(.*)$')
+token_re = re.compile(r'\s*(?:(\d\w*)|(\w+)|(&&|\|\||==|!=|<=|>=|<<|>>|'
+                      r'[!~()<>+\-*/%&|^]))')
+# directives allowed outside of conditional blocks
+neutral_directives = frozenset(['include', 'define', 'undef', 'pragma'])
+config_prefix = 'CONFIG_'
+# version of the scan results stored in the cache
+cache_version = 2
+
+binary_operators = {
+    '||': (1, lambda a, b: int(bool(a or b))),
+    '&&': (2, lambda a, b: int(bool(a and b))),
+    '|': (3, lambda a, b: a | b),
+    '^': (4, lambda a, b: a ^ b),
+    '&': (5, lambda a, b: a & b),
+    '==': (6, lambda a, b: int(a == b)),
+    '!=': (6, lambda a, b: int(a != b)),
+    '<': (7, lambda a, b: int(a < b)),
+    '>': (7, lambda a, b: int(a > b)),
+    '<=': (7, lambda a, b: int(a <= b)),
+    '>=': (7, lambda a, b: int(a >= b)),
+    '<<': (8, lambda a, b: a << b),
+    '>>': (8, lambda a, b: a >> b),
+    '+': (9, lambda a, b: a + b),
+    '-': (9, lambda a, b: a - b),
+    '*': (10, lambda a, b: a * b),
+    '/': (10, lambda a, b: a // b),
+    '%': (10, lambda a, b: a % b),
+}
+
+
+class UnknownCondition(Exception):
+    pass
+
+
+def scan_conditional_blocks(content):
+    """
+    @return tuple (blocks, includes) or None when the source contains
+    anything else than conditional blocks and neutral directives or when
+    it defines a CONFIG_ symbol. Blocks are the top level conditional
+    blocks, each of them is a list of branches (directive, condition).
+    Includes are the included files that precede any of the blocks.
+    """
+    content = comment_re.sub(' ', content.replace('\\\n', ''))
+    blocks = []
+    includes = []
+    pending_includes = []
+    depth = 0
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        match = directive_re.match(line)
+        if match is None:
+            if depth == 0:
+                return None
+            continue
+        directive, argument = match.group(1), match.group(2).strip()
+        if directive in ('define', 'undef') and \
+           argument.startswith(config_prefix):
+            return None
+        if directive == 'include':
+            pending_includes.append(argument)
+        if directive in ('if', 'ifdef', 'ifndef'):
+            if depth == 0:
+                blocks.append([(directive, argument)])
+                includes.extend(pending_includes)
+                pending_includes = []
+            depth += 1
+        elif directive in ('elif', 'else'):
+            if depth == 1:
+                blocks[-1].append((directive, argument))
+        elif directive == 'endif':
+            depth -= 1
+        elif depth == 0 and directive not in neutral_directives:
+            return None
+
+    return (blocks, includes) if depth == 0 else None
+
+
+class ConditionEvaluator(object):
+    """Evaluates preprocessor conditions with configuration symbols
+
+    @param symbols - dictionary of configuration symbols (without CONFIG_
+    prefix) and their values
+    """
+    def __init__(self, symbols):
+        self.symbols = symbols
+
+    def tokenize(self, condition):
+        tokens = []
+        position = 0
+        condition = condition.strip()
+        while position < len(condition):
+            match = token_re.match(condition, position)
+            if match is None:
+                raise UnknownCondition(condition)
+            tokens.append(match.group(match.lastindex))
+            position = match.end()
+        return tokens
+
+    def symbol_value(self, name):
+        if not name.startswith(config_prefix):
+            raise UnknownCondition(name)
+        value = self.symbols.get(name[len(config_prefix):], False)
+        if value is True:
+            return 1
+        if value is False:
+            return 0
+        try:
+            return int(value, 0) if not isinstance(value, int) else value
+        except (TypeError, ValueError):
+            raise UnknownCondition(name)
+
+    def is_defined(self, name):
+        if not name.startswith(config_prefix):
+            raise UnknownCondition(name)
+        return self.symbols.get(name[len(config_prefix):], False) \
+            is not False
+
+    def evaluate(self, condition):
+        tokens = self.tokenize(condition)
+        value = self.expression(tokens, 0)
+        if tokens:
+            raise UnknownCondition(condition)
+        return value
+
+    def expression(self, tokens, min_precedence):
+        value = self.unary(tokens)
+        while tokens and tokens[0] in binary_operators and \
+                binary_operators[tokens[0]][0] >= min_precedence:
+            precedence, operation = binary_operators[tokens.pop(0)]
+            value = operation(value, self.expression(tokens, precedence + 1))
+        return value
+
+    def unary(self, tokens):
+        if not tokens:
+            raise UnknownCondition('incomplete condition')
+        token = tokens.pop(0)
+        if token == '!':
+            return int(not self.unary(tokens))
+        if token == '-':
+            return -self.unary(tokens)
+        if token == '~':
+            return ~self.unary(tokens)
+        if token == '(':
+            value = self.expression(tokens, 0)
+            if not tokens or tokens.pop(0) != ')':
+                raise UnknownCondition('unbalanced parentheses')
+            return value
+        if token == 'defined':
+            parenthesized = tokens and tokens[0] == '('
+            if parenthesized:
+                tokens.pop(0)
+            if not tokens:
+                raise UnknownCondition('incomplete defined')
+            value = int(self.is_defined(tokens.pop(0)))
+            if parenthesized and (not tokens or tokens.pop(0) != ')'):
+                raise UnknownCondition('unbalanced parentheses')
+            return value
+        if token[0].isdigit():
+            try:
+                return int(token.rstrip('uUlL'), 0)
+            except ValueError:
+                raise UnknownCondition(token)
+        return self.symbol_value(token)
+
+    def branch_is_taken(self, directive, argument):
+        """
+        @return True when the branch may be compiled
+        """
+        if directive == 'else':
+            return True
+        if directive == 'ifdef':
+            return self.is_defined(argument)
+        if directive == 'ifndef':
+            return not self.is_defined(argument)
+        return bool(self.evaluate(argument))
+
+    def is_dead(self, blocks):
+        """
+        @return True when there are conditional blocks and no branch of
+        any of them is taken
+        """
+        if not blocks:
+            return False
+        try:
+            return not any(self.branch_is_taken(directive, argument)
+                           for block in blocks
+                           for directive, argument in block)
+        except (UnknownCondition, ZeroDivisionError):
+            return False
+
+
+class DeadUnitScanner(object):
+    """Scans sources for conditional blocks
+
+    Results are cached per content digest, the digest of a file is
+    recalculated only when its modification time or size change.
+    """
+    def __init__(self):
+        self.cache_path = None
+        self.files = {}
+        self.digests = {}
+        self.modified = False
+        self.skipped = 0
+
+    def load(self, cache_path):
+        self.cache_path = cache_path
+        try:
+            with open(cache_path, 'rb') as f:
+                version, files, digests = pickle.load(f)
+            if version == cache_version:
+                self.files, self.digests = files, digests
+        except Exception:
+            # missing or corrupted cache is simply created again
+            pass
+
+    def save(self):
+        if self.modified:
+            with open(self.cache_path, 'wb') as f:
+                pickle.dump((cache_version, self.files, self.digests), f,
+                            pickle.HIGHEST_PROTOCOL)
+
+    def conditional_blocks(self, path):
+        """
+        @return conditional blocks and includes of the source or None (see
+        scan_conditional_blocks)
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_mtime, st.st_size)
+        entry = self.files.get(path)
+        if entry is None or entry[0] != key:
+            with open(path, 'rb') as source_file:
+                content = source_file.read()
+            digest = hashlib.md5(content).hexdigest()
+            if digest not in self.digests:
+                self.digests[digest] = scan_conditional_blocks(
+                    content.decode('latin-1'))
+            entry = (key, digest)
+            self.files[path] = entry
+            self.modified = True
+
+        return self.digests[entry[1]]
+
+    def dead_sources(self, env, sources):
+        """
+        @return sources that compile into empty objects in the current
+        configuration
+        """
+        evaluator = ConditionEvaluator(
+            pila.configdeps.config_symbols(env['CONFIG']))
+        config_header = env.subst('$CONFIG_HEADER')
+        result = []
+        for s in sources:
+            scan = self.conditional_blocks(env.File(s).srcnode().abspath)
+            if scan is None:
+                continue
+            blocks, includes = scan
+            # only the configuration header may define CONFIG_ symbols
+            # evaluated by the blocks
+            if [i for i in includes
+                    if os.path.basename(i.strip('"<> ')) != config_header]:
+                continue
+            if evaluator.is_dead(blocks):
+                result.append(s)
+        return result
+
+    def live_sources(self, env, sources):
+        """
+        @return sources without the dead ones, the dead sources are counted
+        as skipped
+        """
+        dead = self.dead_sources(env, sources)
+        self.skipped += len(dead)
+        return [s for s in sources if s not in dead]
+
+    def is_dead(self, env, sources):
+        """
+        @return True when all sources compile into empty objects in the
+        current configuration
+        """
+        if len(self.dead_sources(env, sources)) < len(sources):
+            return False
+        self.skipped += len(sources)
+        return True
+
+    def report(self):
+        if self.skipped:
+            print('pila: dead translation units skipped: {}'.format(
+                self.skipped))
+        self.save()
+
+
+scanner = None
+
+
+def setup(env):
+    """Loads the scan cache, statistics are reported at the end of the
+    build
+    """
+    global scanner
+    scanner = DeadUnitScanner()
+    scanner.load(env.File('#$DEAD_UNITS_CACHE').abspath)
+    atexit.register(scanner.report)
+
+
+def is_dead(env, source):
+    """
+    @return True when all sources of a feature object are dead
+    """
+    sources = env.Flatten(source)
+    return scanner is not None and 'CONFIG' in env and bool(sources) and \
+        scanner.is_dead(env, sources)
+
+
+def live_sources(env, source):
+    """
+    @return sources of a feature object without the dead ones
+    """
+    sources = env.Flatten(source)
+    if scanner is None or 'CONFIG' not in env:
+        return sources
+    return scanner.live_sources(env, sources)
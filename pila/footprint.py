@@ -0,0 +1,312 @@
+"""memory footprint analysis
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+When ENABLE_FOOTPRINT is set, the map file of each component program is
+parsed in a single pass after the link. Sizes of .text, .rodata, .data
+and .bss are attributed to built-in objects, projects (Kconfig prefixes
+of <PREFIX>_DIR symbols) and global symbols. The result is stored in
+<program>.footprint.json that serves as a baseline for the next build
+(or $FOOTPRINT_BASELINE is used), differences are stored in
+<program>.footprint.diff.
+
+The build fails when flash (text + rodata + data) or RAM (data + bss)
+exceeds $FOOTPRINT_BUDGETS or grows more than $FOOTPRINT_GROWTH_BUDGETS
+against the baseline. A failed analysis keeps the previous baseline.
+"""
+import json
+import os
+import pila.events
+import pila.output
+import pila.trace
+import pila.verbosity
+
+categories = ('text', 'rodata', 'data', 'bss')
+
+# section name prefixes of the categories, input section names are
+# tried first, then the name of the output section
+category_prefixes = (
+    ('.text', 'text'), ('.init', 'text'), ('.fini', 'text'),
+    ('.isr_vector', 'text'), ('.vectors', 'text'),
+    ('.rodata', 'rodata'), ('.srodata', 'rodata'), ('.ARM.exidx', 'rodata'),
+    ('.ARM.extab', 'rodata'),
+    ('.data', 'data'), ('.sdata', 'data'), ('.tdata', 'data'),
+    ('.ramfunc', 'data'),
+    ('.bss', 'bss'), ('.sbss', 'bss'), ('.tbss', 'bss'), ('COMMON', 'bss'),
+    ('.noinit', 'bss'),
+)
+
+# memory regions composed of categories
+regions = (('flash', ('text', 'rodata', 'data')), ('ram', ('data', 'bss')))
+
+# indentation of symbols in the map file
+symbol_indent = ' ' * 16
+
+# number of the biggest changes printed after the build
+summary_size = 10
+
+
+def category(section):
+    for prefix, name in category_prefixes:
+        if section.startswith(prefix):
+            return name
+    return None
+
+
+class InputSection(object):
+    """Input section of the map file along with global symbols defined
+    in it
+    """
+    __slots__ = ('category', 'address', 'size', 'origin', 'symbols')
+
+    def __init__(self, category, address, size, origin):
+        self.category = category
+        self.address = address
+        self.size = size
+        self.origin = origin
+        self.symbols = []
+
+
+class Footprint(object):
+    """Sizes of categories per built-in object, project and symbol"""
+    def __init__(self):
+        self.totals = dict((c, 0) for c in categories)
+        self.built_ins = {}
+        self.symbols = {}
+
+    def add(self, table, key, category, size):
+        sizes = table.setdefault(key, {})
+        sizes[category] = sizes.get(category, 0) + size
+
+    def add_section(self, section):
+        """Attributes the input section to its origin and symbols. Bytes
+        that precede the first symbol are attributed to the origin.
+        """
+        self.totals[section.category] += section.size
+        # members of archives are attributed to the archive
+        origin = section.origin.split('(', 1)[0]
+        self.add(self.built_ins, origin, section.category, section.size)
+        end = section.address + section.size
+        symbols = sorted(section.symbols)
+        unnamed = symbols[0][0] - section.address if symbols else \
+            section.size
+        if unnamed:
+            self.add(self.symbols, '({})'.format(origin), section.category,
+                     unnamed)
+        for i, (address, name) in enumerate(symbols):
+            next_address = symbols[i + 1][0] if i + 1 < len(symbols) else end
+            self.add(self.symbols, name, section.category,
+                     next_address - address)
+
+    def parse_map(self, map_file):
+        """Parses memory map of the GNU ld map file in a single pass"""
+        in_memory_map = False
+        output_section = ''
+        pending_name = None
+        section = None
+        for line in map_file:
+            if not in_memory_map:
+                in_memory_map = line.startswith('Linker script and memory map')
+                continue
+            if not line.strip():
+                continue
+            fields = line.split()
+            if not line[0].isspace():
+                # output section (long names continue on the next line)
+                output_section = fields[0]
+                continue
+            if line.startswith(symbol_indent):
+                # symbol (address and name), continuation of an input
+                # section or an assignment
+                if not fields[0].startswith('0x'):
+                    continue
+                if section is not None and len(fields) == 2:
+                    section.symbols.append((int(fields[0], 16), fields[1]))
+                elif pending_name is not None and len(fields) >= 3:
+                    section = self.input_section(pending_name, fields,
+                                                 output_section)
+                pending_name = None
+                continue
+            if section is not None:
+                self.add_section(section)
+                section = None
+            pending_name = None
+            if line.startswith(' *') or fields[0] == '*fill*':
+                continue
+            if len(fields) == 1:
+                # long input section name continues on the next line
+                pending_name = fields[0]
+            elif len(fields) >= 4 and fields[1].startswith('0x'):
+                section = self.input_section(fields[0], fields[1:],
+                                             output_section)
+        if section is not None:
+            self.add_section(section)
+
+    @classmethod
+    def input_section(clz, name, fields, output_section):
+        """
+        @param fields - address, size and origin of the section
+        @return InputSection or None if the section doesn't occupy memory
+        """
+        size = int(fields[1], 16)
+        kind = category(name) or category(output_section)
+        if not size or kind is None or len(fields) < 3:
+            return None
+        return InputSection(kind, int(fields[0], 16), size,
+                            ' '.join(fields[2:]))
+
+    def projects(self, env):
+        """
+        @return sizes of categories per project
+        """
+        project_dirs = pila.trace.Tracer.project_dirs(env)
+        result = {}
+        for built_in, sizes in self.built_ins.items():
+            project = None
+            if not os.path.isabs(built_in):
+                built_in = env.File('#' + built_in).srcnode().abspath
+            path = os.path.realpath(built_in)
+            for directory, prefix in project_dirs:
+                if path.startswith(directory):
+                    project = prefix
+                    break
+            for c, size in sizes.items():
+                self.add(result, str(project), c, size)
+        return result
+
+    def to_dict(self, env):
+        result = {
+            'totals': self.totals,
+            'built_ins': self.built_ins,
+            'projects': self.projects(env),
+            'symbols': self.symbols,
+        }
+        for name, region_categories in regions:
+            result['totals'][name] = sum(self.totals[c]
+                                         for c in region_categories)
+        return result
+
+
+def symbol_diff(baseline, current):
+    """
+    @return list of (delta, category, symbol), the biggest change first
+    """
+    diff = []
+    baseline_symbols = baseline.get('symbols', {})
+    for name in set(baseline_symbols) | set(current['symbols']):
+        old = baseline_symbols.get(name, {})
+        new = current['symbols'].get(name, {})
+        for c in categories:
+            delta = new.get(c, 0) - old.get(c, 0)
+            if delta:
+                diff.append((delta, c, name))
+    return sorted(diff, key=lambda d: (-abs(d[0]), d[2], d[1]))
+
+
+def check_budgets(env, baseline, current):
+    """
+    @return list of messages about exceeded budgets
+    """
+    violations = []
+    budgets = env['FOOTPRINT_BUDGETS']
+    growth_budgets = env['FOOTPRINT_GROWTH_BUDGETS']
+    for name, _ in regions:
+        size = current['totals'][name]
+        if name in budgets and size > budgets[name]:
+            violations.append('{} {} bytes exceeds budget {} bytes'.format(
+                name, size, budgets[name]))
+        if name in growth_budgets and baseline:
+            growth = size - baseline.get('totals', {}).get(name, size)
+            if growth > growth_budgets[name]:
+                violations.append('{} grew by {} bytes, growth budget {} '
+                                  'bytes'.format(name, growth,
+                                                 growth_budgets[name]))
+    return violations
+
+
+def analyze_footprint(env, target, source):
+    """Parses the map file of the program and compares the result with
+    the baseline
+
+    :param env: environment with budgets and $FOOTPRINT_BASELINE
+    :param target: footprint (JSON) and the diff
+    :param source: component program and settings value
+    """
+    footprint = Footprint()
+    with open('{}.map'.format(source[0])) as map_file:
+        footprint.parse_map(map_file)
+    current = footprint.to_dict(env)
+
+    baseline_path = env.subst('$FOOTPRINT_BASELINE') or str(target[0])
+    try:
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+    except (IOError, ValueError):
+        baseline = {}
+
+    diff = symbol_diff(baseline, current)
+    with pila.output.GeneratedFile(str(target[1])) as diff_file:
+        diff_file.write('# baseline: {}\n'.format(
+            baseline_path if baseline else 'none'))
+        for name, _ in regions:
+            diff_file.write('{} {} {:+d}\n'.format(
+                name, current['totals'][name], current['totals'][name] -
+                baseline.get('totals', {}).get(name, current['totals'][name])))
+        for delta, c, name in diff:
+            diff_file.write('{:+d} {} {}\n'.format(delta, c, name))
+
+    print('footprint: {}'.format(', '.join(
+        '{} {} bytes'.format(name, current['totals'][name])
+        for name, _ in regions)))
+    for delta, c, name in diff[:summary_size]:
+        print('  {:+8d} {:6} {}'.format(delta, c, name))
+
+    violations = check_budgets(env, baseline, current)
+    for v in violations:
+        print('Footprint budget exceeded: {}'.format(v))
+    if violations:
+        # the baseline is kept, so that the growth is reported again
+        return 1
+
+    with pila.output.GeneratedFile(str(target[0])) as footprint_file:
+        json.dump(current, footprint_file, sort_keys=True,
+                  separators=(',', ':'))
+
+
+class FootprintAnalyzer(object):
+    """Analyzes footprint of component programs"""
+    def __init__(self):
+        self.analyze_action = \
+            pila.verbosity.Action(analyze_footprint, '[footprint] $TARGET')
+
+    def register_feature_object(self, env, target, source, *args, **kw):
+        pass
+
+    def register_built_in_object(self, env, target_env, built_in_name, *args,
+                                 **kw):
+        pass
+
+    def register_component_program(self, env, target, *args, **kw):
+        settings = env.Value(repr([env.subst('$FOOTPRINT_BASELINE'),
+                                   sorted(env['FOOTPRINT_BUDGETS'].items()),
+                                   sorted(env['FOOTPRINT_GROWTH_BUDGETS'].
+                                          items())]))
+        footprint = env.Command(['%s.footprint.json' % target,
+                                 '%s.footprint.diff' % target],
+                                [target, settings],
+                                action=self.analyze_action)
+        # the previous footprint is the baseline
+        env.Precious(footprint)
@@ -53,6 +53,26 @@ def set_config_generator(option, opt, value, parser, config_generator):
     setattr(parser.values, option.dest, config_generator)
 
 
+def python_value(value):
+    """Converts configuration value into its python representation
+
+    @return int, bool (y/n) or the value itself
+    """
+    try:
+        out_value = int(value)
+    except ValueError:
+        if (value == 'y'):
+            out_value = True
+        # no value for this config represented by absence of the
+        # macro
+        elif (value == 'n'):
+            out_value = False
+        else:
+            out_value = value
+
+    return out_value
+
+
 class ConfigGenerator(object):
     def __init__(self, out_file=sys.stdout):
         self.out_file = out_file
@@ -93,7 +113,7 @@ class CHeaderConfigGenerator(ConfigGenerator):
         prefix = "#define"
         try:
             out_value = int(value)
-        except ValueError, e:
+        except ValueError:
             if (value == "y"):
                 out_value = 1
             # no value for this config represented by absence of the
@@ -127,12 +147,12 @@ class MakeConfigGenerator(ConfigGenerator):
     """
 
     def output_config(self, config, value):
-        self.out_file.write('%s = %s' % (config, value))
-        self.out_file.write('export %s' % config)
+        self.out_file.write('%s = %s\n' % (config, value))
+        self.out_file.write('export %s\n' % config)
 
 
     def output_comment(self, comment):
-        self.out_file.write('# %s' % comment)
+        self.out_file.write('# %s\n' % comment)
 
 
 
@@ -162,18 +182,9 @@ class PythonConfigGenerator(ConfigGenerator):
     """
 
     def output_config(self, config, value):
-        try:
-            out_value = int(value)
-        except ValueError, e:
-            if (value == 'y'):
-                out_value = 'True'
-            # no value for this config represented by absence of the
-            # macro
-            elif (value == 'n'):
-                out_value = 'False'
-
-            else:
-                out_value = "'%s'" % value
+        out_value = python_value(value)
+        if isinstance(out_value, str):
+            out_value = "'%s'" % out_value
         # Each config option is stored as an attribute without the
         # 'CONFIG_' prefix
         self.out_file.write('        self.%s = %s\n' % (config[len('CONFIG_'):], out_value))
@@ -239,48 +250,112 @@ class GenConfigOptionParser(OptionParser):
 
 
 
-def process_dot_config(in_file, config_generator):
-    """
-    Processes a .config generated by kconfig-frontends
-    @param generator - generator used for output of the configuration
+comment_re = re.compile(r'\s*#\s*(?P<comment>.*)')
+
+# filter out configuration and value, skip any trailing comment
+config_re = re.compile(r'\s*(?P<config>[\w]+)\s*=(?P<value>[^#]+).*')
+
+# filter out unset configuration option comment
+unset_config_re = re.compile(r'#\s*(?P<config>[\w]+) is not set')
+
+# values that can never denote a path
+plain_value_re = re.compile(r'^([yn]|-?[0-9]+|0[xX][0-9a-fA-F]+)?$')
+
+
+class ConfigTable(object):
+    """Symbol table of a parsed .config
+
+    The table keeps the original order of all configuration options and
+    comments, so that it can be rendered by any configuration generator
+    without parsing the .config again.
     """
-    comment_re_str = "\s*#\s*(?P<comment>.*)"
-    comment_re = re.compile(comment_re_str)
+    def __init__(self):
+        # list of (config, value) tuples, comments have config set to None
+        self.entries = []
+        # config -> value
+        self.symbols = {}
+
+    def add_config(self, config, value):
+        self.entries.append((config, value))
+        self.symbols[config] = value
+
+    def add_comment(self, comment):
+        self.entries.append((None, comment))
+
+    def __contains__(self, config):
+        return config in self.symbols
+
+    def __getitem__(self, config):
+        return self.symbols[config]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def get(self, config, default=None):
+        return self.symbols.get(config, default)
+
+    def generate(self, *config_generators):
+        """Renders the table by all specified generators at once"""
+        for g in config_generators:
+            g.output_header()
+        for config, value in self.entries:
+            if config is None:
+                for g in config_generators:
+                    g.output_comment(value)
+            else:
+                for g in config_generators:
+                    g.output_config(config, value)
+        for g in config_generators:
+            g.output_footer()
 
-    # filter out configuration and value, skip any trailing comment
-    config_re_str = "\s*(?P<config>[\w]+)\s*=(?P<value>[^#]+).*"
-    config_re = re.compile(config_re_str)
 
-    # filter out unset configuration option comment
-    unset_config_re_str = '#\s*(?P<config>[\w]+) is not set'
-    unset_config_re = re.compile(unset_config_re_str)
+def parse_dot_config(in_file):
+    """
+    Parses a .config generated by kconfig-frontends in a single pass.
+    Potential paths are converted to absolute paths.
 
-    lines = in_file.readlines()
-    config_generator.output_header()
-    for line in lines:
+    @param in_file - iterable of .config lines
+    @return ConfigTable
+    """
+    table = ConfigTable()
+    for line in in_file:
         line = line.rstrip('\n')
 
         m = unset_config_re.match(line)
         if m:
-            config_generator.output_config(m.group('config'), 'n')
+            table.add_config(m.group('config'), 'n')
             continue
 
         m = comment_re.match(line)
         if m:
-            config_generator.output_comment(m.group('comment'))
+            table.add_comment(m.group('comment'))
             continue
 
         m = config_re.match(line)
         if m:
             config_value = m.group('value').strip().strip('"')
-            # detect paths and convert them to absolute paths
-            if os.path.isdir(config_value) or config_value.startswith('./') \
-                    or config_value.startswith('../'):
+            # detect paths and convert them to absolute paths, only
+            # values that may denote a path are checked
+            if plain_value_re.match(config_value) is None and \
+                    (config_value.startswith('./') or
+                     config_value.startswith('../') or
+                     os.path.isdir(config_value)):
                 config_value = os.path.realpath(config_value)
 
-            config_generator.output_config(m.group('config'),
-                                           config_value)
-        config_generator.output_footer()
+            table.add_config(m.group('config'), config_value)
+
+    return table
+
+
+def process_dot_config(in_file, config_generator):
+    """
+    Processes a .config generated by kconfig-frontends
+    @param config_generator - generator used for output of the
+    configuration, a list of generators may be specified as well
+    """
+    if not isinstance(config_generator, (list, tuple)):
+        config_generator = [config_generator]
+    parse_dot_config(in_file).generate(*config_generator)
 
 
 if __name__ == "__main__":
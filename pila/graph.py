@@ -0,0 +1,497 @@
+"""build graph snapshot
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Reading all SConscripts of a large tree takes considerable time even
+when there is nothing to rebuild. The recorder captures all calls of
+pila builders (FeatureObject, BuiltInObject, ComponentProgram,
+PrecompiledHeader) made while setting up the build environment along
+with changes of construction variables they have been called with. Subsequent runs
+replay the calls instead of reading the SConscripts as long as none of
+the SConscripts, python modules within the tree, .config and command
+line arguments change.
+
+Only nodes created by pila builders are restored. Builders and graph
+modifying methods (Depends, Alias, Default, ...) called by SConscripts
+outside of pila builders are detected and the snapshot is not stored.
+"""
+import numbers
+import os
+import sys
+import types
+import SCons.Builder
+import SCons.Environment
+import SCons.Node.FS
+import SCons.Script
+import SCons.Util
+import pila
+import pila.builders
+import pila.output
+import pila.pch
+import pila.registry
+import pila.snapshot
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+# builders whose calls are recorded
+recorded_methods = {
+    'FeatureObject': pila.builders.FeatureObject,
+    'BuiltInObject': pila.builders.BuiltInObject,
+    'ComponentProgram': pila.builders.ComponentProgram,
+    'PrecompiledHeader': pila.pch.PrecompiledHeader,
+}
+
+# methods of build environments that modify the build graph, they must not
+# be called by SConscripts directly as the calls are not replayed
+graph_methods = ('Alias', 'AlwaysBuild', 'Clean', 'Depends', 'Ignore',
+                 'NoCache', 'NoClean', 'Precious', 'Requires', 'SideEffect')
+
+# construction variables that are not recorded, replayed calls use only
+# standard builders
+ignored_vars = frozenset(['BUILDERS'])
+
+
+class UnsupportedValue(Exception):
+    """Value that cannot be stored in the snapshot"""
+    pass
+
+
+class NodeRef(object):
+    """Reference to a file system node"""
+    __slots__ = ('kind', 'path')
+
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+
+    def __reduce__(self):
+        return (NodeRef, (self.kind, self.path))
+
+    def node(self, env):
+        return getattr(env, self.kind)(self.path)
+
+
+class EnvRef(object):
+    """Reference to a recorded build environment"""
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __reduce__(self):
+        return (EnvRef, (self.index,))
+
+
+def snapshot_key(env):
+    """
+    @return key of everything that influences the build graph apart
+    from files tracked by the snapshot
+    """
+    return (pila.__version__, sys.version, os.getcwd(),
+            env.subst('$DOT_CONFIG'),
+            sorted(SCons.Script.ARGUMENTS.items()))
+
+
+def existing_path(node):
+    """
+    @return path of the file that is really read for the node, sources
+    in variant directories without duplication are read from their
+    source directory
+    """
+    for n in (node, node.srcnode()):
+        if os.path.exists(n.abspath):
+            return n.abspath
+    return node.abspath
+
+
+def describe_builder(builder, env, target=None, source=None, *args, **kw):
+    if target is None:
+        target = source
+    return 'builder of {}'.format(' '.join(str(t) for t in
+                                           env.Flatten(target)))
+
+
+def method_description(name):
+    """
+    @return function that describes a call of the environment method
+    """
+    return lambda *args, **kw: name
+
+
+class GraphRecorder(object):
+    """Records calls of pila builders.
+
+    Every build environment involved in a call is recorded by its index
+    and the changes of its construction variables since its previous
+    call (or since the environment passed to LoadBuildEnv for newly
+    created environments).
+    """
+    def __init__(self, env):
+        self.envs = {}
+        self.calls = []
+        self.dirs = set()
+        self.sconscripts = set()
+        self.unsupported = None
+        self.recording = False
+        # nesting level of recorded builder calls
+        self.depth = 0
+        self.pristine = self.variables(env)
+        self.env = env
+        self.env_entry(env)
+
+    @classmethod
+    def variables(clz, env):
+        """
+        @return copy of construction variables, lists, dictionaries and
+        registries are copied as they may be modified in place
+        """
+        result = {}
+        for k, v in env.Dictionary().items():
+            if k in ignored_vars:
+                continue
+            if SCons.Util.is_List(v) or SCons.Util.is_Dict(v):
+                v = v.copy() if SCons.Util.is_Dict(v) else v[:]
+            elif isinstance(v, pila.registry.Registry):
+                v = pila.registry.Registry(v)
+            result[k] = v
+        return result
+
+    def env_entry(self, env):
+        """
+        @return [index, environment, construction variables after its last
+        recorded call]
+        """
+        entry = self.envs.get(id(env))
+        if entry is None:
+            entry = [len(self.envs), env, self.pristine]
+            self.envs[id(env)] = entry
+        return entry
+
+    def encode(self, value, entries):
+        """Converts the value into a form that can be stored in the snapshot
+
+        @param entries - list where entries of build environments referenced
+        by the value are collected, None when environments are not allowed
+        """
+        if value is None or SCons.Util.is_String(value) or \
+           isinstance(value, numbers.Number):
+            return value
+        if isinstance(value, SCons.Environment.Base):
+            if entries is None:
+                raise UnsupportedValue('build environment in a construction '
+                                       'variable')
+            entry = self.env_entry(value)
+            if entry not in entries:
+                entries.append(entry)
+            return EnvRef(entry[0])
+        if isinstance(value, SCons.Node.FS.Base):
+            if isinstance(value, SCons.Node.FS.Dir):
+                kind = 'Dir'
+            elif isinstance(value, SCons.Node.FS.File):
+                kind = 'File'
+            else:
+                kind = 'Entry'
+            self.dirs.add(value.dir)
+            return NodeRef(kind, value.abspath)
+        if isinstance(value, pila.snapshot.Config):
+            return value
+        if SCons.Util.is_Dict(value):
+            if type(value) is not dict:
+                raise UnsupportedValue(type(value).__name__)
+            return dict((k, self.encode(v, entries)) for k, v in value.items())
+        if isinstance(value, pila.registry.Registry):
+            return pila.registry.Registry([self.encode(v, entries)
+                                           for v in value])
+        if SCons.Util.is_Sequence(value):
+            encoded = [self.encode(v, entries) for v in value]
+            if type(value) in (tuple, SCons.Util.CLVar):
+                return type(value)(encoded)
+            return encoded
+        if isinstance(value, (types.FunctionType, types.BuiltinFunctionType)):
+            # module level functions are pickled by reference
+            module = sys.modules.get(value.__module__)
+            if getattr(module, value.__name__, None) is value:
+                return value
+        raise UnsupportedValue('{} {!r}'.format(type(value).__name__, value))
+
+    def delta(self, entry):
+        """
+        @return tuple (environment index, changed variables, deleted
+        variables) since the last recorded call of the environment
+        """
+        current = self.variables(entry[1])
+        last = entry[2]
+        changed = {}
+        for k, v in current.items():
+            if k not in last or last[k] != v:
+                changed[k] = self.encode(v, None)
+        deleted = [k for k in last if k not in current]
+
+        return (entry[0], changed, deleted)
+
+    def record_call(self, name, env, args, kw):
+        """Records a single call of a builder
+
+        @return entries of all environments involved in the call
+        """
+        entries = [self.env_entry(env)]
+        args = self.encode(args, entries)
+        kw = self.encode(kw, entries)
+        states = [self.delta(entry) for entry in entries]
+        cwd = env.fs.getcwd()
+        self.dirs.add(cwd)
+        self.calls.append((name, states, cwd.abspath, args, kw))
+
+        return entries
+
+    def wrap(self, name, method):
+        """
+        @return method that records its calls while recording is active
+        """
+        recorder = self
+
+        def recorded_method(env, *args, **kw):
+            entries = []
+            if recorder.recording and recorder.unsupported is None:
+                try:
+                    entries = recorder.record_call(name, env, args, kw)
+                except UnsupportedValue as e:
+                    recorder.unsupported = '{}: unsupported value {}'.format(
+                        name, e)
+            recorder.depth += 1
+            try:
+                result = method(env, *args, **kw)
+            finally:
+                recorder.depth -= 1
+            # remember state of the environments so that the next call
+            # records only changes made by SConscripts
+            for entry in entries:
+                entry[2] = recorder.variables(entry[1])
+
+            return result
+
+        return recorded_method
+
+    def guard(self, describe, method):
+        """
+        @return method that prevents storing the snapshot when it is called
+        outside of recorded builders while recording is active
+        @param describe - provides description of the call from its
+        arguments
+        """
+        recorder = self
+
+        def guarded_method(*args, **kw):
+            if recorder.recording and recorder.depth == 0 and \
+               recorder.unsupported is None:
+                recorder.unsupported = '{} called outside of pila ' \
+                    'builders would not be replayed'.format(describe(*args))
+            return method(*args, **kw)
+
+        return guarded_method
+
+    def record(self, setup_build_env):
+        """Calls setup_build_env and records all builder calls and
+        SConscripts being read
+
+        Any other builder or graph modifying method called by SConscripts
+        prevents storing the snapshot.
+        """
+        for name, method in recorded_methods.items():
+            self.env.AddMethod(self.wrap(name, method), name)
+        guarded = [(SCons.Builder.BuilderBase, '__call__', describe_builder)]
+        guarded.extend((SCons.Environment.Base, name, method_description(name))
+                       for name in graph_methods)
+        originals = [(clz, name, clz.__dict__[name])
+                     for clz, name, describe in guarded]
+        for clz, name, describe in guarded:
+            setattr(clz, name, self.guard(describe, clz.__dict__[name]))
+        default_targets = len(SCons.Script.DEFAULT_TARGETS)
+        for frame in SCons.Script._SConscript.call_stack:
+            if frame.sconscript is not None:
+                self.sconscripts.add(existing_path(frame.sconscript))
+
+        frame_class = SCons.Script._SConscript.Frame
+        recorder = self
+
+        class RecordingFrame(frame_class):
+            """Frame of SConscript being read, notes the SConscript"""
+            def __init__(self, fs, exports, sconscript):
+                frame_class.__init__(self, fs, exports, sconscript)
+                if self.sconscript is not None:
+                    recorder.sconscripts.add(existing_path(self.sconscript))
+
+        SCons.Script._SConscript.Frame = RecordingFrame
+        self.recording = True
+        try:
+            setup_build_env(self.env)
+        finally:
+            self.recording = False
+            SCons.Script._SConscript.Frame = frame_class
+            for clz, name, method in originals:
+                setattr(clz, name, method)
+        if self.unsupported is None and \
+           len(SCons.Script.DEFAULT_TARGETS) != default_targets:
+            self.unsupported = 'Default called by SConscripts would not ' \
+                'be replayed'
+            for name, method in recorded_methods.items():
+                self.env.AddMethod(method, name)
+
+    def variant_dir_links(self):
+        """
+        @return list of (variant dir, source dir, duplicate) for all
+        directories that have been referenced, parents come first
+        """
+        links = set()
+        for d in self.dirs:
+            while d is not None:
+                if d.srcdir is not None:
+                    links.add((d.abspath, d.srcdir.abspath, d.duplicate))
+                parent = d.up()
+                d = parent if parent is not d else None
+
+        return sorted(links, key=lambda l: len(l[0]))
+
+    def tracked_files(self):
+        """
+        @return all files that the recorded graph has been derived from:
+        SConscripts, python modules within the tree and the configuration
+        """
+        files = set(self.sconscripts)
+        top = self.env.Dir('#').abspath + os.sep
+        for module in list(sys.modules.values()):
+            path = getattr(module, '__file__', None)
+            if path is None:
+                continue
+            if path.endswith(('.pyc', '.pyo')):
+                path = path[:-1]
+            path = os.path.abspath(path)
+            if path.startswith(top) and os.path.exists(path):
+                files.add(path)
+        files.add(os.path.abspath(self.env.subst('$DOT_CONFIG')))
+
+        return sorted(files)
+
+    def save(self, path):
+        """Stores the recorded graph unless it contains anything that
+        cannot be replayed
+        """
+        if self.unsupported is None:
+            try:
+                # final state of the top level environment
+                self.calls.append((None, [self.delta(self.envs[id(self.env)])],
+                                   None, (), {}))
+            except UnsupportedValue as e:
+                self.unsupported = 'unsupported value {}'.format(e)
+        if self.unsupported is not None:
+            print('pila: build graph snapshot not stored, {}'.format(
+                self.unsupported))
+            return
+
+        header = {
+            'key': snapshot_key(self.env),
+            'files': [(f, pila.output.file_digest(f))
+                      for f in self.tracked_files()],
+        }
+        graph = {
+            'links': self.variant_dir_links(),
+            'calls': self.calls,
+        }
+        pila.snapshot.write_atomically(
+            path, pickle.dumps(header, pickle.HIGHEST_PROTOCOL) +
+            pickle.dumps(graph, pickle.HIGHEST_PROTOCOL))
+
+
+def load_graph(env, path):
+    """Loads recorded graph
+
+    @return the graph or None when the snapshot is missing or
+    outdated
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+            if header['key'] != snapshot_key(env):
+                return None
+            for tracked_path, digest in header['files']:
+                if pila.output.file_digest(tracked_path) != digest:
+                    return None
+            return pickle.load(f)
+    except Exception:
+        # missing or corrupted snapshot is simply recorded again
+        return None
+
+
+def decode(value, envs):
+    if isinstance(value, NodeRef):
+        return value.node(envs[0])
+    if isinstance(value, EnvRef):
+        return envs[value.index]
+    if type(value) is dict:
+        return dict((k, decode(v, envs)) for k, v in value.items())
+    if type(value) in (list, tuple, SCons.Util.CLVar):
+        return type(value)([decode(v, envs) for v in value])
+    if isinstance(value, pila.registry.Registry):
+        return pila.registry.Registry([decode(v, envs) for v in value])
+    return value
+
+
+def replay(env, graph):
+    """Recreates the build graph by replaying recorded builder calls"""
+    for variant_dir, src_dir, duplicate in graph['links']:
+        env.VariantDir(variant_dir, src_dir, duplicate=duplicate)
+
+    pristine = env.Clone()
+    envs = {0: env}
+    fs = env.fs
+    top = fs.getcwd()
+    try:
+        for name, states, cwd, args, kw in graph['calls']:
+            for index, changed, deleted in states:
+                if index not in envs:
+                    envs[index] = pristine.Clone()
+                call_env = envs[index]
+                call_env.Replace(**decode(changed, envs))
+                for k in deleted:
+                    if k in call_env:
+                        del call_env[k]
+            if name is None:
+                continue
+            fs.chdir(env.Dir(cwd), change_os_dir=False)
+            recorded_methods[name](envs[states[0][0]], *decode(args, envs),
+                                   **decode(kw, envs))
+    finally:
+        fs.chdir(top, change_os_dir=False)
+
+
+def setup_build_env(env, setup_build_env):
+    """Sets up the build environment from the graph snapshot
+    ($GRAPH_SNAPSHOT) if it is up to date. Otherwise, setup_build_env
+    is called and the snapshot is recorded.
+    """
+    snapshot_path = env.subst('$GRAPH_SNAPSHOT')
+    graph = load_graph(env, snapshot_path)
+    if graph is not None:
+        replay(env, graph)
+        print('pila: build graph restored from {}'.format(snapshot_path))
+    else:
+        recorder = GraphRecorder(env)
+        recorder.record(setup_build_env)
+        recorder.save(snapshot_path)
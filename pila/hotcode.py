@@ -0,0 +1,169 @@
+"""hot code placement
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+A function hotness profile (e.g. aggregated PC samples or a trace dump)
+selects the hottest functions of a component program. Their sections
+(.text.<function>, the sources have to be compiled with
+-ffunction-sections) are listed in a linker script fragment as long as
+they fit into $HOT_CODE_BUDGET bytes. The linker script of the program
+includes the fragment in an output section placed into fast memory
+(ITCM/RAM).
+
+LTO objects contain no function sections until the final link, hot code
+placement therefore cannot be combined with LTO.
+"""
+import re
+import subprocess
+import SCons.Errors
+import SCons.Warnings
+import pila.output
+import pila.verbosity
+
+
+class HotCodeWarning(SCons.Warnings.Warning):
+    pass
+
+
+section_prefix = '.text.'
+
+# [Nr] Name Type Address Off Size ... (readelf -S -W)
+section_header_re = re.compile(r'^\s*\[\s*\d+\]\s+(\S+)\s+\S+\s+'
+                               r'[0-9a-fA-F]+\s+[0-9a-fA-F]+\s+'
+                               r'([0-9a-fA-F]+)\s')
+
+
+def parse_profile(profile_file):
+    """Parses the function hotness profile
+
+    Each line contains a function name and its hotness (e.g. number of
+    samples or calls) in any order, lines starting with '#' are comments.
+    Repeated functions are summed up.
+
+    @return list of (function, hotness), the hottest function first
+    """
+    hotness = {}
+    for line_num, line in enumerate(profile_file, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if len(fields) != 2:
+            raise SCons.Errors.StopError(
+                HotCodeWarning,
+                '{}:{}: expected function and hotness: {}'.format(
+                    profile_file.name, line_num, line.strip()))
+        if fields[0].isdigit():
+            fields.reverse()
+        function, count = fields
+        try:
+            hotness[function] = hotness.get(function, 0) + int(count)
+        except ValueError:
+            raise SCons.Errors.StopError(
+                HotCodeWarning,
+                '{}:{}: invalid hotness: {}'.format(profile_file.name,
+                                                    line_num, count))
+
+    return sorted(hotness.items(), key=lambda h: (-h[1], h[0]))
+
+
+def section_sizes(env, objects):
+    """
+    @return dictionary of function section sizes in the objects, sizes of
+    equally named sections (e.g. static functions) are summed up
+    """
+    output = subprocess.check_output([env.subst('$READELF'), '-S', '-W'] +
+                                     [str(o) for o in objects])
+    sizes = {}
+    for line in output.decode('utf-8', 'replace').splitlines():
+        match = section_header_re.match(line)
+        if match and match.group(1).startswith(section_prefix):
+            name = match.group(1)
+            sizes[name] = sizes.get(name, 0) + int(match.group(2), 16)
+
+    return sizes
+
+
+def select_hot_sections(profile, sizes, budget):
+    """Selects sections of the hottest functions that fit into the budget
+
+    @return list of (section, function, size, hotness)
+    """
+    selected = []
+    used = 0
+    for function, hotness in profile:
+        section = section_prefix + function
+        size = sizes.get(section)
+        if size is None or used + size > budget:
+            continue
+        used += size
+        selected.append((section, function, size, hotness))
+
+    return selected
+
+
+def create_hot_code_fragment(env, target, source):
+    """Creates linker script fragment with sections of the hottest functions
+
+    :param env: environment with $READELF
+    :param target: linker script fragment
+    :param source: hotness profile, budget value and built-in objects
+    """
+    budget = int(source[1].read())
+    with open(str(source[0])) as profile_file:
+        profile = parse_profile(profile_file)
+    selected = select_hot_sections(profile, section_sizes(env, source[2:]),
+                                   budget)
+    used = sum(s[2] for s in selected)
+    with pila.output.GeneratedFile(str(target[0])) as fragment:
+        fragment.write('/* generated by pila from {}: {} functions, {} of {} '
+                       'bytes */\n'.format(source[0], len(selected), used,
+                                           budget))
+        for section, function, size, hotness in selected:
+            fragment.write('*({}) /* {} bytes, hotness {} */\n'.format(
+                section, size, hotness))
+
+    print('hot code: {} functions moved, {} of {} bytes used:'.format(
+        len(selected), used, budget))
+    for section, function, size, hotness in selected:
+        print('  {:8} bytes  hotness {:10}  {}'.format(size, hotness,
+                                                       function))
+
+
+hot_code_action = pila.verbosity.Action(create_hot_code_fragment,
+                                        '[hot code] $TARGET')
+
+
+def HotCodeFragment(env, target, profile, built_ins):
+    """Provides linker script fragment with hot functions of the program
+
+    @param target - component program
+    @param profile - function hotness profile
+    @param built_ins - built-in objects of the program
+    @return the fragment node
+    """
+    if env['ENABLE_LTO']:
+        raise SCons.Errors.StopError(
+            HotCodeWarning,
+            'Hot code profile {} of {} cannot be used with LTO, built-in '
+            'objects contain no function sections'.format(
+                env.subst(str(profile)), env.subst(str(target))))
+    budget = env.Value(env.subst('$HOT_CODE_BUDGET'))
+    fragment = env.Command('%s.hot-code.ld' % target,
+                           [profile, budget] + built_ins,
+                           action=hot_code_action)
+    # the fragment is rewritten only when its content changes
+    env.Precious(fragment)
+    return fragment[0]
@@ -0,0 +1,829 @@
+#!/usr/bin/python
+
+"""native Kconfig evaluator
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Purpose: this module parses Kconfig files and evaluates the configuration
+in-process. It covers the non-interactive operations of kconfig-frontends
+(olddefconfig, alldefconfig, savedefconfig), so that configuration can be
+refreshed without spawning an external frontend.
+
+Supported language: config, menuconfig, choice/endchoice, menu/endmenu,
+if/endif, comment, mainmenu, source (and rsource/osource/orsource), types
+bool, tristate, string, int, hex, prompt, default, def_bool,
+def_tristate, depends on, select, imply, range, visible if, optional,
+option env and help texts.
+
+Run 'kconfig.py -h' for details
+"""
+
+import glob
+import os
+import re
+import sys
+
+from optparse import OptionParser
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class KconfigError(Exception):
+    pass
+
+
+# tristate values
+N, M, Y = 0, 1, 2
+tristate_names = {'n': N, 'm': M, 'y': Y}
+tristate_strings = ('n', 'm', 'y')
+
+token_re = re.compile(r'''
+    \s*(?:
+      (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<op>&&|\|\||!=|<=|>=|[!()=<>])
+    | (?P<word>[^\s"'!()=<>&|#]+)
+    | (?P<comment>\#.*)
+    )''', re.VERBOSE)
+
+env_ref_re = re.compile(r'\$\((\w+)\)|\$\{(\w+)\}|\$(\w+)')
+
+
+def unquote(s):
+    return re.sub(r'\\(.)', r'\1', s[1:-1])
+
+
+def tokenize(line, filename, lineno):
+    """
+    @return list of tokens, strings are represented by ('str', value)
+    tuples, everything else by plain strings
+    """
+    tokens = []
+    pos = 0
+    line = line.rstrip()
+    while pos < len(line):
+        m = token_re.match(line, pos)
+        if m is None or m.end() == pos:
+            if line[pos:].strip() == '':
+                break
+            raise KconfigError('%s:%d: syntax error near "%s"' %
+                               (filename, lineno, line[pos:]))
+        pos = m.end()
+        if m.group('comment') is not None:
+            break
+        if m.group('string') is not None:
+            tokens.append(('str', unquote(m.group('string'))))
+        elif m.group('op') is not None:
+            tokens.append(m.group('op'))
+        elif m.group('word') is not None:
+            tokens.append(m.group('word'))
+
+    return tokens
+
+
+def expand_env(s):
+    return env_ref_re.sub(lambda m: os.environ.get(
+        m.group(1) or m.group(2) or m.group(3), ''), s)
+
+
+class ExprParser(object):
+    """Recursive descent parser of Kconfig expressions
+
+    Expressions are represented by nested tuples:
+    ('sym', name), ('str', constant), ('not', e), ('and', a, b),
+    ('or', a, b), (op, a, b) where op is one of comparison operators
+    """
+    comparison_ops = ('=', '!=', '<', '>', '<=', '>=')
+
+    def __init__(self, tokens, filename, lineno):
+        self.tokens = tokens
+        self.pos = 0
+        self.filename = filename
+        self.lineno = lineno
+
+    def error(self, msg):
+        raise KconfigError('%s:%d: %s' % (self.filename, self.lineno, msg))
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            self.error('unexpected end of expression')
+        self.pos += 1
+        return token
+
+    def parse(self):
+        return self.parse_or()
+
+    def parse_or(self):
+        expr = self.parse_and()
+        while self.peek() == '||':
+            self.next()
+            expr = ('or', expr, self.parse_and())
+        return expr
+
+    def parse_and(self):
+        expr = self.parse_not()
+        while self.peek() == '&&':
+            self.next()
+            expr = ('and', expr, self.parse_not())
+        return expr
+
+    def parse_not(self):
+        if self.peek() == '!':
+            self.next()
+            return ('not', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        expr = self.parse_atom()
+        if self.peek() in self.comparison_ops:
+            op = self.next()
+            expr = (op, expr, self.parse_atom())
+        return expr
+
+    def parse_atom(self):
+        token = self.next()
+        if token == '(':
+            expr = self.parse_or()
+            if self.next() != ')':
+                self.error('missing closing parenthesis')
+            return expr
+        if isinstance(token, tuple):
+            return token
+        if token in self.comparison_ops or token in ('&&', '||', ')'):
+            self.error('unexpected "%s"' % token)
+        return ('sym', token)
+
+
+def expr_and(*exprs):
+    result = None
+    for e in exprs:
+        if e is None:
+            continue
+        result = e if result is None else ('and', result, e)
+    return result
+
+
+def expr_or(*exprs):
+    result = None
+    for e in exprs:
+        if e is None:
+            continue
+        result = e if result is None else ('or', result, e)
+    return result
+
+
+class MenuNode(object):
+    """Node of the menu tree (menu, if block, choice, comment or symbol
+    definition)"""
+    def __init__(self, kind, parent, item=None, title=None):
+        self.kind = kind
+        self.parent = parent
+        self.item = item
+        self.title = title
+        self.deps = []
+        self.visible_if = []
+        self.children = []
+
+    def full_dep(self):
+        node = self
+        exprs = []
+        while node is not None:
+            exprs.extend(node.deps)
+            node = node.parent
+        return expr_and(*exprs)
+
+    def full_visibility(self):
+        node = self
+        exprs = []
+        while node is not None:
+            exprs.extend(node.visible_if)
+            node = node.parent
+        return expr_and(*exprs)
+
+
+class Symbol(object):
+    def __init__(self, name):
+        self.name = name
+        self.type = None
+        # list of (text, condition)
+        self.prompts = []
+        # list of (expr, condition)
+        self.defaults = []
+        # list of (target name, condition)
+        self.selects = []
+        self.implies = []
+        # list of (selector name, condition), filled in by finalization
+        self.rev_deps = []
+        self.weak_rev_deps = []
+        # list of (low, high, condition)
+        self.ranges = []
+        self.dep = None
+        self.env_var = None
+        self.choice = None
+        self.help = ''
+
+    def is_bool(self):
+        return self.type in ('bool', 'tristate')
+
+
+class Choice(object):
+    def __init__(self, name):
+        self.name = name
+        self.type = 'bool'
+        self.prompts = []
+        self.defaults = []
+        self.members = []
+        self.dep = None
+        self.optional = False
+        self.help = ''
+
+
+class Kconfig(object):
+    """Parsed Kconfig tree with an evaluator of symbol values"""
+    type_keywords = ('bool', 'boolean', 'tristate', 'string', 'int', 'hex')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.mainmenu = None
+        self.symbols = {}
+        self.choices = []
+        self.top = MenuNode('menu', None)
+        # (path, mtime, size) of all parsed files, used for cache
+        # validation
+        self.files = []
+        self.parse_file(filename, self.top)
+        self.finalize()
+        self.user_values = {}
+        self.cache = {}
+        self.evaluating = set()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['cache'] = {}
+        state['user_values'] = {}
+        state['evaluating'] = set()
+        return state
+
+    # -- parsing ------------------------------------------------------
+
+    def logical_lines(self, filename):
+        """Yields (lineno, indentation, raw line) with line continuations
+        joined"""
+        with open(filename, 'r') as f:
+            pending = ''
+            start = None
+            for lineno, line in enumerate(f, 1):
+                line = line.rstrip('\n')
+                if start is None:
+                    start = lineno
+                if line.endswith('\\'):
+                    pending += line[:-1]
+                    continue
+                yield start, pending + line
+                pending = ''
+                start = None
+            if pending:
+                yield start, pending
+
+    def get_symbol(self, name):
+        sym = self.symbols.get(name)
+        if sym is None:
+            sym = self.symbols[name] = Symbol(name)
+        return sym
+
+    def parse_file(self, filename, parent):
+        if not os.path.exists(filename):
+            raise KconfigError('Kconfig file %s not found' % filename)
+        st = os.stat(filename)
+        self.files.append((filename, st.st_mtime, st.st_size))
+
+        node = parent
+        item_node = None
+        help_indent = None
+        in_help = False
+        help_item = None
+
+        for lineno, line in self.logical_lines(filename):
+            indent = len(line.expandtabs()) - len(line.expandtabs().lstrip())
+            if in_help:
+                if line.strip() == '':
+                    help_item.help += '\n'
+                    continue
+                if help_indent is None:
+                    help_indent = indent
+                if indent >= help_indent:
+                    help_item.help += line.strip() + '\n'
+                    continue
+                in_help = False
+
+            tokens = tokenize(line, filename, lineno)
+            if not tokens:
+                continue
+            keyword = tokens[0]
+            args = tokens[1:]
+
+            def expr(tokens):
+                return ExprParser(tokens, filename, lineno).parse()
+
+            def split_if(tokens):
+                if 'if' in tokens:
+                    i = tokens.index('if')
+                    return tokens[:i], expr(tokens[i + 1:])
+                return tokens, None
+
+            def text(token):
+                return token[1] if isinstance(token, tuple) else token
+
+            if keyword in ('config', 'menuconfig'):
+                sym = self.get_symbol(args[0])
+                item_node = MenuNode('symbol', node, item=sym)
+                node.children.append(item_node)
+                if node.kind == 'choice':
+                    sym.choice = node.item
+                    node.item.members.append(sym)
+            elif keyword == 'choice':
+                choice = Choice(args[0] if args else None)
+                self.choices.append(choice)
+                item_node = node = MenuNode('choice', node, item=choice)
+                node.parent.children.append(node)
+            elif keyword == 'endchoice':
+                node = node.parent
+                item_node = None
+            elif keyword == 'menu':
+                item_node = node = MenuNode('menu', node,
+                                            title=text(args[0]))
+                node.parent.children.append(node)
+            elif keyword == 'endmenu':
+                node = node.parent
+                item_node = None
+            elif keyword == 'if':
+                node = MenuNode('if', node)
+                node.deps.append(expr(args))
+                node.parent.children.append(node)
+                item_node = None
+            elif keyword == 'endif':
+                node = node.parent
+                item_node = None
+            elif keyword == 'comment':
+                item_node = MenuNode('comment', node, title=text(args[0]))
+                node.children.append(item_node)
+            elif keyword == 'mainmenu':
+                self.mainmenu = text(args[0])
+                item_node = None
+            elif keyword in ('source', 'rsource', 'osource', 'orsource'):
+                path = expand_env(text(args[0]))
+                if keyword.startswith('r') or keyword.startswith('or'):
+                    path = os.path.join(os.path.dirname(filename), path)
+                paths = sorted(glob.glob(path))
+                if not paths and not keyword.startswith('o'):
+                    raise KconfigError('%s:%d: sourced file %s not found' %
+                                       (filename, lineno, path))
+                for p in paths:
+                    self.parse_file(p, node)
+                item_node = None
+            elif item_node is None:
+                raise KconfigError('%s:%d: unexpected "%s"' %
+                                   (filename, lineno, keyword))
+            elif keyword in ('help', '---help---'):
+                in_help = True
+                help_indent = None
+                help_item = item_node.item or item_node
+                if not hasattr(help_item, 'help'):
+                    help_item.help = ''
+            elif keyword == 'depends':
+                item_node.deps.append(expr(args[1:]))
+            elif keyword == 'visible':
+                item_node.visible_if.append(expr(args[1:]))
+            elif keyword in self.type_keywords or \
+                    keyword in ('def_bool', 'def_tristate'):
+                item = item_node.item
+                item.type = {'boolean': 'bool', 'def_bool': 'bool',
+                             'def_tristate': 'tristate'}.get(keyword, keyword)
+                rest, cond = split_if(args)
+                if keyword.startswith('def_'):
+                    item.defaults.append((item_node, expr(rest), cond))
+                elif rest:
+                    item.prompts.append((item_node, text(rest[0]), cond))
+            elif keyword == 'prompt':
+                rest, cond = split_if(args)
+                item_node.item.prompts.append((item_node, text(rest[0]), cond))
+            elif keyword == 'default':
+                rest, cond = split_if(args)
+                item_node.item.defaults.append((item_node, expr(rest), cond))
+            elif keyword in ('select', 'imply'):
+                rest, cond = split_if(args)
+                props = item_node.item.selects if keyword == 'select' \
+                    else item_node.item.implies
+                props.append((item_node, rest[0], cond))
+            elif keyword == 'range':
+                rest, cond = split_if(args)
+                item_node.item.ranges.append((item_node, rest[0], rest[1],
+                                              cond))
+            elif keyword == 'optional':
+                item_node.item.optional = True
+            elif keyword == 'option':
+                option = args[0]
+                if option == 'env' and len(args) >= 3:
+                    item_node.item.env_var = text(args[2])
+            else:
+                raise KconfigError('%s:%d: unknown keyword "%s"' %
+                                   (filename, lineno, keyword))
+
+        if node is not parent:
+            raise KconfigError('%s: unterminated menu, if or choice block' %
+                               filename)
+
+    def finalize(self):
+        """Resolves properties of all definitions into expressions with
+        dependencies of enclosing menus and if blocks"""
+        for item in list(self.symbols.values()) + self.choices:
+            prompts = []
+            for node, prompt, cond in item.prompts:
+                prompts.append((prompt, expr_and(node.full_dep(), cond,
+                                                 node.full_visibility())))
+            defaults = [(value, expr_and(node.full_dep(), cond))
+                        for node, value, cond in item.defaults]
+            item.prompts = prompts
+            item.defaults = defaults
+
+        for sym in self.symbols.values():
+            for node, target, cond in sym.selects:
+                self.get_symbol(target).rev_deps.append((sym.name, cond))
+            for node, target, cond in sym.implies:
+                self.get_symbol(target).weak_rev_deps.append((sym.name,
+                                                              cond))
+            sym.ranges = [(low, high, expr_and(node.full_dep(), cond))
+                          for node, low, high, cond in sym.ranges]
+
+        # dependencies of all definitions of each symbol
+        def collect_deps(node):
+            for child in node.children:
+                if child.kind in ('symbol', 'choice'):
+                    child.item.dep = expr_or(child.item.dep,
+                                             child.full_dep() or
+                                             ('sym', 'y'))
+                collect_deps(child)
+        collect_deps(self.top)
+
+    # -- evaluation ---------------------------------------------------
+
+    def load_config(self, filename):
+        """Loads user values from an existing .config"""
+        config_re = re.compile(r'^CONFIG_(\w+)=(.*)$')
+        unset_re = re.compile(r'^# CONFIG_(\w+) is not set$')
+        self.user_values = {}
+        self.cache = {}
+        with open(filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                m = config_re.match(line)
+                if m:
+                    value = m.group(2)
+                    if value.startswith('"'):
+                        value = unquote(value)
+                    self.user_values[m.group(1)] = value
+                    continue
+                m = unset_re.match(line)
+                if m:
+                    self.user_values[m.group(1)] = 'n'
+
+    def reset(self):
+        self.user_values = {}
+        self.cache = {}
+
+    def eval(self, expr):
+        """Evaluates an expression into a tristate value"""
+        if expr is None:
+            return Y
+        kind = expr[0]
+        if kind == 'sym':
+            name = expr[1]
+            if name in tristate_names:
+                return tristate_names[name]
+            sym = self.symbols.get(name)
+            if sym is None or not sym.is_bool():
+                return N
+            return self.tri_value(sym)
+        if kind == 'str':
+            return tristate_names.get(expr[1], N)
+        if kind == 'not':
+            return Y - self.eval(expr[1])
+        if kind == 'and':
+            return min(self.eval(expr[1]), self.eval(expr[2]))
+        if kind == 'or':
+            return max(self.eval(expr[1]), self.eval(expr[2]))
+        return self.compare(kind, self.operand_value(expr[1]),
+                            self.operand_value(expr[2]))
+
+    def operand_value(self, expr):
+        if expr[0] == 'str':
+            return expr[1]
+        name = expr[1]
+        sym = self.symbols.get(name)
+        if sym is None:
+            return name
+        return self.str_value(sym)
+
+    @staticmethod
+    def compare(op, a, b):
+        try:
+            a, b = int(a, 0), int(b, 0)
+        except ValueError:
+            pass
+        result = {'=': a == b, '!=': a != b, '<': a < b, '>': a > b,
+                  '<=': a <= b, '>=': a >= b}[op]
+        return Y if result else N
+
+    def visibility(self, item):
+        vis = N
+        for prompt, cond in item.prompts:
+            vis = max(vis, self.eval(cond))
+        if isinstance(item, Symbol) and item.choice is not None:
+            vis = min(vis, self.visibility(item.choice))
+        if item.type == 'bool' and vis == M:
+            vis = Y
+        return vis
+
+    def rev_dep(self, rev_deps):
+        value = N
+        for selector, cond in rev_deps:
+            value = max(value, min(self.tri_value(self.symbols[selector]),
+                                   self.eval(cond)))
+        return value
+
+    def default_value(self, sym):
+        for expr, cond in sym.defaults:
+            cond_value = self.eval(cond)
+            if cond_value != N:
+                if sym.is_bool():
+                    return min(self.eval(expr), cond_value)
+                return self.operand_value(expr)
+        if sym.env_var is not None:
+            return os.environ.get(sym.env_var, '')
+        return N if sym.is_bool() else ''
+
+    def evaluate(self, sym, use_user_value=True):
+        """Calculates symbol value without caching.
+
+        @return tristate for bool/tristate symbols, string otherwise
+        """
+        if sym.is_bool():
+            if sym.choice is not None:
+                return Y if self.choice_selection(sym.choice) is sym else N
+            vis = self.visibility(sym)
+            user = self.user_values.get(sym.name) if use_user_value else None
+            if vis != N and user in tristate_names:
+                value = min(tristate_names[user], vis)
+            else:
+                value = min(self.default_value(sym), self.eval(sym.dep))
+                if user is None or vis == N:
+                    value = max(value, min(self.rev_dep(sym.weak_rev_deps),
+                                           self.eval(sym.dep)))
+            value = max(value, self.rev_dep(sym.rev_deps))
+            if sym.type == 'bool' and value == M:
+                value = Y
+            return value
+
+        if self.eval(sym.dep) == N:
+            return ''
+        user = self.user_values.get(sym.name) if use_user_value else None
+        if self.visibility(sym) != N and user is not None and \
+                self.in_range(sym, user):
+            return user
+        return self.default_value(sym)
+
+    def in_range(self, sym, value):
+        if sym.type not in ('int', 'hex'):
+            return True
+        try:
+            value = int(value, 0)
+        except ValueError:
+            return False
+        for low, high, cond in sym.ranges:
+            if self.eval(cond) != N:
+                low = int(self.operand_value(('sym', low)), 0)
+                high = int(self.operand_value(('sym', high)), 0)
+                return low <= value <= high
+        return True
+
+    def value(self, sym):
+        if sym.name not in self.cache:
+            if sym.name in self.evaluating:
+                raise KconfigError('dependency loop detected at symbol %s' %
+                                   sym.name)
+            self.evaluating.add(sym.name)
+            try:
+                self.cache[sym.name] = self.evaluate(sym)
+            finally:
+                self.evaluating.discard(sym.name)
+        return self.cache[sym.name]
+
+    def tri_value(self, sym):
+        return self.value(sym) if sym.is_bool() else N
+
+    def str_value(self, sym):
+        value = self.value(sym)
+        if sym.is_bool():
+            return tristate_strings[value]
+        return value
+
+    def choice_selection(self, choice):
+        """
+        @return the selected member symbol of the choice or None
+        """
+        key = id(choice)
+        if key in self.cache:
+            return self.cache[key]
+        self.cache[key] = None
+        selection = None
+        if self.visibility(choice) != N:
+            visible = [m for m in choice.members if self.visibility(m) != N]
+            for m in visible:
+                if self.user_values.get(m.name) == 'y':
+                    selection = m
+                    break
+            if selection is None and not choice.optional:
+                selection = self.default_selection(choice, visible)
+        self.cache[key] = selection
+        return selection
+
+    def default_selection(self, choice, visible):
+        for expr, cond in choice.defaults:
+            if self.eval(cond) != N:
+                sym = self.symbols.get(expr[1])
+                if sym in visible:
+                    return sym
+        return visible[0] if visible else None
+
+    def is_written(self, sym):
+        """Symbols are written when their dependencies are satisfied or
+        they are selected"""
+        if sym.type is None:
+            return False
+        if sym.choice is not None:
+            return self.eval(sym.choice.dep) != N
+        return self.eval(sym.dep) != N or \
+            (sym.is_bool() and self.rev_dep(sym.rev_deps) != N)
+
+    # -- output -------------------------------------------------------
+
+    @staticmethod
+    def format_symbol(sym, value):
+        if sym.is_bool():
+            if value == 'n':
+                return '# CONFIG_%s is not set\n' % sym.name
+            return 'CONFIG_%s=%s\n' % (sym.name, value)
+        if sym.type == 'string':
+            return 'CONFIG_%s="%s"\n' % (sym.name, value.replace(
+                '\\', '\\\\').replace('"', '\\"'))
+        return 'CONFIG_%s=%s\n' % (sym.name, value)
+
+    def write_config(self, out_file):
+        """Writes complete configuration in .config format"""
+        out_file.write('#\n# Automatically generated file; DO NOT EDIT.\n')
+        if self.mainmenu:
+            out_file.write('# %s\n' % expand_env(self.mainmenu))
+        out_file.write('#\n')
+        written = set()
+
+        def write_node(node):
+            for child in node.children:
+                if child.kind in ('menu', 'comment'):
+                    if self.eval(child.full_dep()) == N:
+                        continue
+                    out_file.write('\n#\n# %s\n#\n' % child.title)
+                elif child.kind == 'symbol':
+                    sym = child.item
+                    if sym.name not in written and self.is_written(sym):
+                        written.add(sym.name)
+                        value = self.str_value(sym)
+                        if sym.is_bool() or sym.type == 'string' or value:
+                            out_file.write(self.format_symbol(sym, value))
+                write_node(child)
+
+        write_node(self.top)
+
+    def write_min_config(self, out_file):
+        """Writes only symbols whose values differ from defaults (the
+        savedefconfig operation)"""
+        written = set()
+
+        def write_node(node):
+            for child in node.children:
+                if child.kind == 'choice':
+                    choice = child.item
+                    selection = self.choice_selection(choice)
+                    visible = [m for m in choice.members
+                               if self.visibility(m) != N]
+                    if selection is not None and \
+                            selection is not self.default_selection(
+                                choice, visible):
+                        out_file.write(self.format_symbol(selection, 'y'))
+                elif child.kind == 'symbol':
+                    sym = child.item
+                    if sym.name in written or sym.choice is not None or \
+                            not self.is_written(sym) or \
+                            self.visibility(sym) == N:
+                        continue
+                    written.add(sym.name)
+                    value = self.value(sym)
+                    if sym.is_bool() and \
+                            value <= self.rev_dep(sym.rev_deps):
+                        continue
+                    if value != self.evaluate(sym, use_user_value=False):
+                        out_file.write(self.format_symbol(
+                            sym, self.str_value(sym)))
+                write_node(child)
+
+        write_node(self.top)
+
+
+def load_kconfig(filename, cache_path=None):
+    """Parses Kconfig tree, optionally using a cache of the parsed tree.
+
+    The cache is valid as long as none of the parsed files has changed.
+
+    @return Kconfig
+    """
+    if cache_path is not None:
+        try:
+            with open(cache_path, 'rb') as f:
+                kconfig = pickle.load(f)
+            if kconfig.filename == filename and \
+                    all(os.path.exists(path) and
+                        (os.stat(path).st_mtime, os.stat(path).st_size) ==
+                        (mtime, size)
+                        for path, mtime, size in kconfig.files):
+                return kconfig
+        except Exception:
+            # missing or corrupted cache is simply regenerated
+            pass
+
+    kconfig = Kconfig(filename)
+    if cache_path is not None:
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(kconfig, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+
+    return kconfig
+
+
+def olddefconfig(kconfig, dot_config, out_file):
+    """Refreshes an existing configuration, new symbols get their
+    default values"""
+    if os.path.exists(dot_config):
+        kconfig.load_config(dot_config)
+    else:
+        kconfig.reset()
+    kconfig.write_config(out_file)
+
+
+def alldefconfig(kconfig, dot_config, out_file):
+    """Creates configuration with all symbols set to their defaults"""
+    kconfig.reset()
+    kconfig.write_config(out_file)
+
+
+def savedefconfig(kconfig, dot_config, out_file):
+    """Saves minimal configuration that differs from defaults"""
+    kconfig.load_config(dot_config)
+    kconfig.write_min_config(out_file)
+
+
+operations = {
+    'olddefconfig': olddefconfig,
+    'alldefconfig': alldefconfig,
+    'savedefconfig': savedefconfig,
+}
+
+
+if __name__ == "__main__":
+    p = OptionParser(usage='%prog [options] KCONFIG OPERATION')
+    p.add_option('-c', '--config', dest='dot_config', default='.config',
+                 help='configuration to read, default: .config')
+    (opts, args) = p.parse_args(sys.argv[1:])
+    if len(args) != 2 or args[1] not in operations:
+        p.error('specify Kconfig and one of: %s' %
+                ', '.join(sorted(operations)))
+
+    operations[args[1]](load_kconfig(args[0]), opts.dot_config, sys.stdout)
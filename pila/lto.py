@@ -0,0 +1,54 @@
+"""link-time optimization
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+LTO is enabled by ENABLE_LTO or by CONFIG_LTO symbol. Feature objects
+are compiled with $LTO_CCFLAGS. Partially linking LTO objects (ld -r)
+would require the linker plugin, therefore, built-in objects fall back
+to thin archives (see builders.BuiltInObject). Archives are created by
+the gcc-ar wrapper ($LTO_AR) that provides the linker plugin, so that
+their symbol index covers the LTO objects.
+
+The component program is linked via the compiler driver, so that the
+LTO code generation is run in $LTO_JOBS parallel partitions. The driver
+is run with -nostdlib, so that the link is equivalent to the plain ld
+link, all linker flags are passed via $LINKFLAGSPREFIX (-Wl,). No
+optimization level is specified for the link, GCC applies optimization
+options the objects have been compiled with (per-project and per-object
+profiles) to each function.
+"""
+
+
+def apply_config_settings(env):
+    """Enables LTO when requested by the configuration unless user has
+    explicitely enabled it when loading the tool
+    """
+    if not env['ENABLE_LTO'] and env['CONFIG'].LTO is True:
+        env['ENABLE_LTO'] = True
+    if env['CONFIG'].LTO_JOBS:
+        env['LTO_JOBS'] = env['CONFIG'].LTO_JOBS
+
+
+def setup(env):
+    """Switches the environment to LTO build"""
+    env.Append(CCFLAGS='$LTO_CCFLAGS')
+    env['AR'] = '$LTO_AR'
+    env['LINK'] = '$CC'
+    env['LINKFLAGSPREFIX'] = '-Wl,'
+    env['LINKCOM'] = env['LINKCOM'].replace(
+        '$LINKFLAGS',
+        '-nostdlib $LTO_LINKFLAGS '
+        '${_concat(LINKFLAGSPREFIX, LINKFLAGS, "", __env__)}')
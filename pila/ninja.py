@@ -0,0 +1,271 @@
+"""ninja generator module
+
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import os
+import sys
+import pila.commandline
+import pila.genconfig
+import pila.output
+import pila.registry
+import pila.verbosity
+
+# sources compiled by gcc that can provide a depfile
+depfile_suffixes = frozenset(['.c', '.cc', '.cpp', '.cxx', '.c++', '.C',
+                              '.S', '.sx', '.spp', '.SPP'])
+
+
+def escape_path(path):
+    return path.replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+
+def escape_value(value):
+    return value.replace('$', '$$')
+
+
+def shell_quote(arg):
+    return "'{}'".format(arg.replace("'", "'\\''"))
+
+
+def precompiled_headers(obj):
+    """
+    @return precompiled headers the object depends on (see pch module)
+    """
+    return [d for d in obj.depends if getattr(d.attributes, 'pila_pch', False)]
+
+
+class NinjaGen(object):
+    """Ninja build file generator
+
+    Each built-in object gets a snippet with build statements of its
+    feature objects and of the built-in itself. Snippets are composed into
+    a complete ninja file for each component program.
+    """
+    def __init__(self):
+        self.ninja_snippet_action = \
+            pila.verbosity.Action(self.create_ninja_snippet,
+                                  '[Ninja snippet] $TARGET')
+        self.ninja_action = \
+            pila.verbosity.Action(self.compose_ninja,
+                                  '[Ninja compose] $TARGET')
+
+    @classmethod
+    def render_build(clz, output, node, rule, inputs, implicit=[],
+                     implicit_outputs=[]):
+        """Renders build statement of the node with its exact command line
+
+        :param output: output file
+        :param node: target node
+        :param rule: ninja rule to be used
+        :param inputs: explicit inputs of the statement
+        :param implicit: implicit dependencies
+        :param implicit_outputs: additional outputs of the statement
+        """
+        outputs = [escape_path(node.path)]
+        if implicit_outputs:
+            outputs.append('|')
+            outputs.extend(escape_path(o) for o in implicit_outputs)
+        deps = [escape_path(str(i)) for i in inputs]
+        if implicit:
+            deps.append('|')
+            deps.extend(escape_path(str(i)) for i in implicit)
+        output.write('build {}: {} {}\n'.format(' '.join(outputs), rule,
+                                                ' '.join(deps)))
+        command = ' && '.join(pila.commandline.command_lines(node))
+        output.write('  cmd = {}\n'.format(escape_value(command)))
+
+    @classmethod
+    def render_generated_file(clz, output, node):
+        """Renders build statement of a file generated by pila whose content
+        is known in advance (node.attributes.pila_content)
+
+        :param output: output file
+        :param node: generated file
+        """
+        lines = node.attributes.pila_content.splitlines()
+        command = "printf '%s\\n' {} > {}".format(
+            ' '.join(shell_quote(l) for l in lines), shell_quote(node.path))
+        output.write('build {}: cmd\n'.format(escape_path(node.path)))
+        output.write('  cmd = {}\n'.format(escape_value(command)))
+
+    @classmethod
+    def built_in_parts(clz, built_in, objects):
+        """
+        @return intermediate objects the built-in object is composed from
+        (see BuiltInObject chunk_size)
+        """
+        objects = set(objects)
+        return [s for s in built_in.sources if s not in objects]
+
+    def create_ninja_snippet(self, env, target, source):
+        """
+        Creates ninja snippet with build statements for all feature objects
+        of a built-in object and for the built-in object itself.
+
+        :param env: environment that carries the objects (PILA_NINJA_OBJECTS)
+        and the built-in (PILA_NINJA_BUILT_IN)
+        :param target: snippet file
+        :param source: sources of the objects (unused)
+        """
+        config_header = env.File('#$VARIANT_DIR/$CONFIG_HEADER').path
+        with pila.output.GeneratedFile(str(target[0])) as snippet:
+            for obj in env['PILA_NINJA_OBJECTS']:
+                # generated sources (e.g. unity sources) stay in the
+                # variant directory
+                sources = [s.path if s.has_builder() else s.srcnode().path
+                           for s in obj.sources]
+                suffix = os.path.splitext(sources[0])[1] if sources else ''
+                rule = 'cc' if suffix in depfile_suffixes else 'cmd'
+                for s in obj.sources:
+                    if hasattr(s.attributes, 'pila_content'):
+                        self.render_generated_file(snippet, s)
+                self.render_build(snippet, obj, rule, sources,
+                                  implicit=[config_header] +
+                                  precompiled_headers(obj))
+            built_in = env['PILA_NINJA_BUILT_IN']
+            for part in self.built_in_parts(built_in,
+                                            env['PILA_NINJA_OBJECTS']):
+                self.render_build(snippet, part, 'cmd', part.sources)
+            self.render_build(snippet, built_in, 'cmd', built_in.sources)
+
+    def compose_ninja(self, env, target, source):
+        """Compose ninja file from all source snippets
+
+        The header of the generated file contains rules, configuration
+        header regeneration and finally the link of the component
+        program.
+
+        :param env: build environment of the component program
+        :param target: output file where the ninja file is to be stored
+        :param source: component program followed by ninja snippets
+        """
+        program = source[0]
+        genconfig = os.path.splitext(pila.genconfig.__file__)[0] + '.py'
+        with pila.output.GeneratedFile(str(target[0])) as ninja:
+            ninja.write('# generated by pila, run ninja -f {} from the top '
+                        'level directory\n'.format(target[0].path))
+            ninja.write('ninja_required_version = 1.3\n\n')
+            ninja.write('rule cc\n'
+                        '  command = $cmd -MMD -MF $out.d\n'
+                        '  depfile = $out.d\n'
+                        '  deps = gcc\n'
+                        '  description = CC $out\n\n')
+            ninja.write('rule cmd\n'
+                        '  command = $cmd\n'
+                        '  description = BUILD $out\n\n')
+            ninja.write('rule config_header\n'
+                        '  command = {} {} --cheader < $in > $out\n'
+                        '  description = CONFIG $out\n\n'.format(
+                            escape_value(sys.executable),
+                            escape_value(genconfig)))
+            config_header = env.File('#$VARIANT_DIR/$CONFIG_HEADER').path
+            ninja.write('build {}: config_header {}\n\n'.format(
+                escape_path(config_header),
+                escape_path(env.File('#$DOT_CONFIG').path)))
+            # precompiled headers embed the configuration header
+            for pch in env.get('PILA_NINJA_PCH', []):
+                header = pch.sources[0]
+                self.render_generated_file(ninja, header)
+                self.render_build(ninja, pch, 'cc', [header],
+                                  implicit=[config_header])
+                ninja.write('\n')
+            for s in source[1:]:
+                with open(str(s)) as snippet:
+                    ninja.write(snippet.read())
+
+            self.render_build(ninja, program, 'cmd', program.sources,
+                              implicit_outputs=['{}.map'.format(program.path)])
+            ninja.write('\ndefault {}\n'.format(escape_path(program.path)))
+
+    def register_feature_object(self, env, target, source, *args, **kw):
+        """Notes builder overrides of the feature object, so that the
+        ninja snippet is regenerated when they change
+
+        :param env:
+        :param target: unused
+        :param source: unused
+        :param args: unused
+        :param kw: builder overrides of the object
+        """
+        if kw:
+            pila.registry.register(env, 'PILA_NINJA_OVERRIDES',
+                                   repr(sorted(kw.items())))
+
+    def register_built_in_object(self, env, target_env, built_in_name, *args,
+                                 **kw):
+        """Generates a ninja snippet for the built-in object.
+
+        The snippet depends on the sources and on a signature of the
+        compiler and linker command lines, so that it is not regenerated
+        during builds without any changes.
+
+        :param env: environment where the feature objects have been built
+        :param target_env: target environment where the resulting snippet
+        needs to be registered
+        :param built_in_name: see BuiltInObject
+        :param args: unused
+        :param kw: unused
+        """
+        objects = pila.registry.registered(env, 'PILA_OBJECTS')
+        built_in = env.File(built_in_name)
+        pchs = []
+        for pch in [p for obj in objects for p in precompiled_headers(obj)]:
+            if pch not in pchs:
+                pchs.append(pch)
+        pila.commandline.keep_command_lines(
+            objects + self.built_in_parts(built_in, objects) + [built_in] +
+            pchs)
+        # precompiled headers are shared by built-ins, they are rendered
+        # only once by the composed ninja file
+        pila.registry.register(target_env, 'PILA_NINJA_PCH', pchs)
+        signature = env.Value('\n'.join(
+            [pila.commandline.command_signature(env, built_in)] +
+            pila.registry.registered(env, 'PILA_NINJA_OVERRIDES')))
+        sources = [s for obj in objects for s in obj.sources]
+        snippet_name = '{}.ninja.snippet'.format(built_in_name)
+        ninja_snippet = env.Command(snippet_name, [signature] + sources,
+                                    action=self.ninja_snippet_action,
+                                    PILA_NINJA_OBJECTS=objects,
+                                    PILA_NINJA_BUILT_IN=built_in)
+        env.Precious(ninja_snippet)
+        pila.registry.register(target_env, 'PILA_NINJA_SNIPPET', ninja_snippet)
+
+    def register_component_program(self, env, target, *args, **kw):
+        """
+        Generates the final ninja file.
+
+        :param env: environment where the ninja file is to be built
+        :param target: component program's target will become the first
+        source
+        :param args: unused
+        :param kw: unused
+        """
+        if 'PILA_NINJA_SNIPPET' in env:
+            pila.commandline.keep_command_lines(env.File(env.Flatten(target)))
+            pchs = []
+            for pch in pila.registry.registered(env, 'PILA_NINJA_PCH'):
+                if pch not in pchs:
+                    pchs.append(pch)
+            ninja = env.Command('%s.ninja' % target,
+                                [target] + pila.registry.registered(
+                                    env, 'PILA_NINJA_SNIPPET'),
+                                action=self.ninja_action,
+                                PILA_NINJA_PCH=pchs)
+            env.Precious(ninja)
+        else:
+            print('Warning: no ninja snippets for {}, this probably means '
+                  'that no built-in object has been declared'.format(target))
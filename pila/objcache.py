@@ -0,0 +1,580 @@
+#!/usr/bin/python
+
+"""content addressed object cache
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Purpose: this script wraps compiler invocations of feature objects and
+stores the resulting objects in a cache directory. The cache is keyed by
+compiler identity (digest of the compiler binary), compiler flags and
+the preprocessed source (that also covers the configuration header
+injected via -imacros). Stack usage (.su) and call graph (.ci) files
+produced next to the object are cached along with it. A manifest of
+all headers that contributed to the preprocessed source allows a cache
+hit without running even the preprocessor (direct mode).
+
+The cache directory may be shared among build trees and machines (e.g.
+via NFS), all files are written atomically. Therefore, paths in the keys
+and manifests are relative to the top directory (the working directory
+of the compilation) and the variant directory is replaced by a
+placeholder. Only compilations with debug information and without
+-fdebug-prefix-map are keyed by the top directory as the object embeds
+it. When the cache grows over
+the specified size, the least recently used objects are evicted.
+
+Run 'objcache.py -h' for details
+"""
+
+import errno
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+from optparse import OptionParser
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# options that are followed by a separate argument
+options_with_argument = set(['-o', '-I', '-D', '-U', '-include', '-imacros',
+                             '-isystem', '-iquote', '-idirafter', '-x',
+                             '-MF', '-MT', '-MQ', '-Xpreprocessor',
+                             '-Xassembler', '-aux-info'])
+# dependency generation options are not passed to the preprocessor
+dependency_options = set(['-MD', '-MMD', '-MP'])
+dependency_options_with_argument = set(['-MF', '-MT', '-MQ'])
+source_suffixes = ('.c', '.cc', '.cpp', '.cxx', '.S', '.s', '.sx')
+# files produced next to the object by the options (file suffix, option
+# or option prefix)
+side_outputs = (('.su', '-fstack-usage'), ('.ci', '-fcallgraph-info'))
+# suffixes of files stored along with each cached object
+stored_suffixes = ('.stderr',) + tuple(s for s, o in side_outputs)
+
+line_marker_re = re.compile(br'^# \d+ "((?:[^"\\]|\\.)*)"', re.MULTILINE)
+
+stats_fields = ('direct_hits', 'preprocessed_hits', 'misses', 'uncacheable')
+# placeholder of the variant directory in keys and manifests
+variant_dir_placeholder = '@VARIANT_DIR@'
+# options that remove the working directory from debug information
+prefix_map_options = ('-fdebug-prefix-map=', '-ffile-prefix-map=')
+# maximum number of dependency variants stored in a manifest
+max_manifest_entries = 16
+
+
+def digest_data(*chunks):
+    digest = hashlib.sha1()
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def digest_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        return None
+
+
+def write_atomically(path, data):
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    tmp_path = '%s.%s.%d.tmp' % (path, os.uname()[1], os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+
+def find_executable(program):
+    if os.path.dirname(program):
+        return os.path.realpath(program)
+    for d in os.environ.get('PATH', '').split(os.pathsep):
+        candidate = os.path.join(d, program)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return os.path.realpath(candidate)
+    return None
+
+
+class PathMap(object):
+    """Converts paths into a form that is independent of the location of
+    the build tree and of the variant directory
+    """
+    def __init__(self, top, variant_dir=None):
+        self.top = os.path.join(os.path.abspath(top), '')
+        self.variant_dir = os.path.normpath(variant_dir) \
+            if variant_dir else None
+
+    def normalize(self, path):
+        if path.startswith(self.top):
+            path = path[len(self.top):]
+        if self.variant_dir is not None and \
+           (path == self.variant_dir or
+                path.startswith(self.variant_dir + os.sep)):
+            path = variant_dir_placeholder + path[len(self.variant_dir):]
+        return path
+
+    def resolve(self, path):
+        if path.startswith(variant_dir_placeholder):
+            path = self.variant_dir + path[len(variant_dir_placeholder):]
+        return path
+
+    def normalize_arg(self, arg):
+        """Normalizes a compiler argument, options with joined paths
+        (-I<dir>) and separate option values are supported
+        """
+        if arg.startswith('-I') and len(arg) > 2:
+            return '-I' + self.normalize(arg[2:])
+        if arg.startswith('-'):
+            return arg
+        return self.normalize(arg)
+
+    def normalize_line_markers(self, preprocessed):
+        def normalize_marker(m):
+            path = self.normalize(m.group(1).decode('utf-8', 'replace'))
+            return m.group(0)[:m.start(1) - m.start(0)] + \
+                path.encode('utf-8') + b'"'
+        return line_marker_re.sub(normalize_marker, preprocessed)
+
+
+class Compilation(object):
+    """Parsed compiler command line"""
+    def __init__(self, argv):
+        self.argv = argv
+        self.compiler = argv[0]
+        self.output = None
+        self.source = None
+        self.compile_only = False
+        self.cacheable = True
+        # arguments that determine the resulting object
+        self.key_args = []
+        # arguments for running the preprocessor
+        self.preprocessor_args = []
+        # files specified on the command line that are read by compiler
+        self.input_files = []
+        self.include_dirs = []
+        # suffixes of files produced next to the object
+        self.side_suffixes = []
+
+        args = argv[1:]
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            value = None
+            if arg in options_with_argument:
+                if i + 1 >= len(args):
+                    self.cacheable = False
+                    break
+                value = args[i + 1]
+                i += 1
+            i += 1
+
+            if arg == '-o':
+                self.output = value
+            elif arg == '-c':
+                self.compile_only = True
+                self.key_args.append(arg)
+            elif arg in ('-E', '-M', '-MM', '-S') or arg.startswith('@'):
+                self.cacheable = False
+            elif arg in dependency_options or \
+                    arg in dependency_options_with_argument:
+                # dependency file would not be produced on a cache hit
+                self.cacheable = False
+            elif not arg.startswith('-') and value is None:
+                if self.source is not None or \
+                        not arg.endswith(source_suffixes):
+                    self.cacheable = False
+                self.source = arg
+            else:
+                for suffix, option in side_outputs:
+                    if arg.startswith(option) and \
+                       suffix not in self.side_suffixes:
+                        self.side_suffixes.append(suffix)
+                if arg in ('-include', '-imacros'):
+                    self.input_files.append(value)
+                elif arg == '-I':
+                    self.include_dirs.append(value)
+                elif arg.startswith('-I'):
+                    self.include_dirs.append(arg[2:])
+                self.key_args.append(arg)
+                self.preprocessor_args.append(arg)
+                if value is not None:
+                    self.key_args.append(value)
+                    self.preprocessor_args.append(value)
+
+        if self.output is None or self.source is None or \
+                not self.compile_only:
+            self.cacheable = False
+
+    def side_output(self, suffix):
+        """
+        @return path of a file produced next to the object
+        """
+        return os.path.splitext(self.output)[0] + suffix
+
+    def resolve_input_files(self):
+        """
+        @return paths of files specified via -include or -imacros, the
+        files are searched in the current directory and include path
+        """
+        paths = []
+        for f in self.input_files:
+            for d in [''] + self.include_dirs:
+                candidate = os.path.join(d, f)
+                if os.path.isfile(candidate):
+                    paths.append(candidate)
+                    break
+        return paths
+
+    def compiler_identity(self):
+        """
+        @return digest of the compiler binary, identical compilers
+        installed in different locations or machines share the results
+        """
+        path = find_executable(self.compiler)
+        if path is None:
+            return None
+        return digest_file(path)
+
+    def preprocess(self):
+        """
+        @return preprocessed source or None when preprocessing fails
+        """
+        process = subprocess.Popen([self.compiler] + self.preprocessor_args +
+                                   ['-E', self.source],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        return out if process.returncode == 0 else None
+
+
+class ObjectCache(object):
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def path(self, kind, key):
+        return os.path.join(self.directory, kind, key[:2], key)
+
+    # -- statistics ---------------------------------------------------
+
+    def update_stats(self, field, size_delta=0):
+        """Updates statistics under a lock
+
+        @return total size of the cache
+        """
+        stats_path = os.path.join(self.directory, 'stats')
+        lock = None
+        try:
+            if fcntl is not None:
+                lock = open(os.path.join(self.directory, 'lock'), 'a')
+                try:
+                    fcntl.lockf(lock, fcntl.LOCK_EX)
+                except IOError:
+                    # locking is not supported by some network file systems
+                    pass
+            stats = self.read_stats()
+            if field is not None:
+                stats[field] += 1
+            stats['size'] = max(0, stats['size'] + size_delta)
+            write_atomically(stats_path, pickle.dumps(stats, 2))
+        finally:
+            if lock is not None:
+                lock.close()
+        return stats['size']
+
+    def read_stats(self):
+        stats = dict((f, 0) for f in stats_fields)
+        stats['size'] = 0
+        try:
+            with open(os.path.join(self.directory, 'stats'), 'rb') as f:
+                stats.update(pickle.load(f))
+        except Exception:
+            pass
+        return stats
+
+    # -- lookup -------------------------------------------------------
+
+    def restore(self, result_key, compilation):
+        """Copies cached object into the output
+
+        @return True on success
+        """
+        object_path = self.path('objects', result_key)
+        try:
+            for suffix in compilation.side_suffixes:
+                shutil.copyfile(object_path + suffix,
+                                compilation.side_output(suffix))
+            shutil.copyfile(object_path, compilation.output)
+            # modification time marks the object as recently used
+            os.utime(object_path, None)
+        except (IOError, OSError):
+            return False
+        try:
+            with open(object_path + '.stderr', 'rb') as f:
+                stderr = f.read()
+        except IOError:
+            stderr = b''
+        if stderr:
+            getattr(sys.stderr, 'buffer', sys.stderr).write(stderr)
+        return True
+
+    def load_manifest(self, manifest_key):
+        try:
+            with open(self.path('manifests', manifest_key), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return []
+
+    def lookup_manifest(self, manifest_key, path_map):
+        """Direct mode lookup: headers of a previous compilation of the
+        same source are still the same
+
+        @return result key or None
+        """
+        for deps, result_key in self.load_manifest(manifest_key):
+            if all(digest_file(path_map.resolve(path)) == digest
+                   for path, digest in deps):
+                return result_key
+        return None
+
+    def store_manifest(self, manifest_key, deps, result_key):
+        entries = [e for e in self.load_manifest(manifest_key)
+                   if e[1] != result_key]
+        entries.insert(0, (deps, result_key))
+        write_atomically(self.path('manifests', manifest_key),
+                         pickle.dumps(entries[:max_manifest_entries], 2))
+
+    def store(self, result_key, compilation, stderr):
+        object_path = self.path('objects', result_key)
+        with open(compilation.output, 'rb') as f:
+            data = f.read()
+        size = len(data) + len(stderr)
+        write_atomically(object_path + '.stderr', stderr)
+        for suffix in compilation.side_suffixes:
+            with open(compilation.side_output(suffix), 'rb') as f:
+                side_data = f.read()
+            write_atomically(object_path + suffix, side_data)
+            size += len(side_data)
+        # the object is stored last, it marks a complete entry
+        write_atomically(object_path, data)
+        return size
+
+    # -- eviction -----------------------------------------------------
+
+    def evict(self):
+        """Removes least recently used objects until the cache fits into
+        90 % of its maximum size"""
+        objects = []
+        total = 0
+        objects_dir = os.path.join(self.directory, 'objects')
+        for root, dirs, files in os.walk(objects_dir):
+            for name in files:
+                if name.endswith(stored_suffixes + ('.tmp',)):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    size = st.st_size + os.path.getsize(path + '.stderr')
+                except OSError:
+                    continue
+                for suffix in stored_suffixes[1:]:
+                    if os.path.exists(path + suffix):
+                        size += os.path.getsize(path + suffix)
+                objects.append((st.st_mtime, size, path))
+                total += size
+
+        objects.sort()
+        removed = 0
+        for mtime, size, path in objects:
+            if total - removed <= self.max_size * 0.9:
+                break
+            for p in [path] + [path + s for s in stored_suffixes]:
+                try:
+                    os.unlink(p)
+                except OSError:
+                    pass
+            removed += size
+        # the stats are resynchronized with the real content
+        self.update_stats(None, total - removed - self.read_stats()['size'])
+
+    # -- compilation --------------------------------------------------
+
+    def compile(self, compilation, path_map):
+        """Runs the compilation via cache
+
+        @param path_map - PathMap of the build tree
+        @return exit code of the compiler
+        """
+        compiler_id = compilation.compiler_identity()
+        source_digest = digest_file(compilation.source)
+        if not compilation.cacheable or compiler_id is None or \
+                source_digest is None:
+            self.update_stats('uncacheable')
+            return subprocess.call(compilation.argv)
+
+        key_args = [path_map.normalize_arg(a) for a in compilation.key_args]
+        source = path_map.normalize(compilation.source)
+        if [a for a in key_args if a.startswith('-g')] and \
+           not [a for a in key_args if a.startswith(prefix_map_options)]:
+            # the object refers to the top directory
+            key_args.append(path_map.top)
+        manifest_key = digest_data(compiler_id,
+                                   *(key_args + [source, source_digest]))
+        result_key = self.lookup_manifest(manifest_key, path_map)
+        if result_key is not None and self.restore(result_key, compilation):
+            self.update_stats('direct_hits')
+            return 0
+
+        preprocessed = compilation.preprocess()
+        if preprocessed is None:
+            self.update_stats('uncacheable')
+            return subprocess.call(compilation.argv)
+        result_key = digest_data(compiler_id, source,
+                                 path_map.normalize_line_markers(preprocessed),
+                                 *key_args)
+
+        # Files injected via -imacros don't appear in line markers
+        deps = set(compilation.resolve_input_files())
+        for m in line_marker_re.finditer(preprocessed):
+            path = m.group(1).decode('utf-8', 'replace')
+            if not path.startswith('<'):
+                deps.add(path)
+        deps.discard(compilation.source)
+        manifest_deps = [(path_map.normalize(path), digest_file(path))
+                         for path in sorted(deps)]
+
+        if self.restore(result_key, compilation):
+            self.update_stats('preprocessed_hits')
+            self.store_manifest(manifest_key, manifest_deps, result_key)
+            return 0
+
+        process = subprocess.Popen(compilation.argv, stderr=subprocess.PIPE)
+        stderr = process.communicate()[1]
+        getattr(sys.stderr, 'buffer', sys.stderr).write(stderr)
+        if process.returncode != 0:
+            self.update_stats('misses')
+            return process.returncode
+
+        size = self.store(result_key, compilation, stderr)
+        self.store_manifest(manifest_key, manifest_deps, result_key)
+        if self.update_stats('misses', size) > self.max_size:
+            self.evict()
+        return 0
+
+
+def parse_size(size):
+    """Converts size with optional K, M or G suffix into bytes"""
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    size = str(size).strip().upper()
+    if size and size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+
+def format_stats(stats):
+    return 'direct hits: {direct_hits}, preprocessed hits: ' \
+        '{preprocessed_hits}, misses: {misses}, uncacheable: ' \
+        '{uncacheable}'.format(**stats)
+
+
+def setup(env):
+    """Routes compilation of C/C++ sources and preprocessed assembler
+    through the cache.
+
+    Statistics of the current build are printed at the end of the build.
+    """
+    import atexit
+    env['OBJCACHE_PREFIX'] = '"%s" "%s" --dir $OBJCACHE_DIR ' \
+                             '--max-size $OBJCACHE_SIZE ' \
+                             '--variant-dir "$VARIANT_DIR"' % \
+                             (sys.executable, os.path.abspath(
+                                 __file__.replace('.pyc', '.py')))
+    # The compiler is substituted separately, otherwise an empty
+    # $CROSS_COMPILE would glue it to the preceding word
+    def compiler(name):
+        return lambda target, source, env, for_signature: \
+            env.subst('$' + name)
+    env['OBJCACHE_CC'] = compiler('CC')
+    env['OBJCACHE_CXX'] = compiler('CXX')
+    for com, cc in (('CCCOM', '$CC'), ('CXXCOM', '$CXX'),
+                    ('ASPPCOM', '$CC')):
+        env[com] = '$OBJCACHE_PREFIX ' + \
+            env[com].replace(cc + ' ', '$OBJCACHE_%s ' % cc[1:], 1)
+
+    cache = ObjectCache(env.subst('$OBJCACHE_DIR'), 0)
+    initial = cache.read_stats()
+
+    def report():
+        current = cache.read_stats()
+        delta = dict((f, current[f] - initial[f]) for f in stats_fields)
+        if any(delta.values()):
+            print('pila object cache: %s' % format_stats(delta))
+
+    atexit.register(report)
+
+
+if __name__ == "__main__":
+    p = OptionParser(usage='%prog [options] COMPILER ARGS...')
+    p.add_option('-d', '--dir', dest='directory',
+                 help='cache directory')
+    p.add_option('-m', '--max-size', dest='max_size', default='5G',
+                 help='maximum size of the cache in bytes, K, M and G '
+                 'suffixes are supported, default: 5G')
+    p.add_option('-v', '--variant-dir', dest='variant_dir',
+                 help='variant directory relative to the working directory, '
+                 'replaced by a placeholder in cache keys')
+    p.add_option('-s', '--show-stats', dest='show_stats',
+                 action='store_true', default=False,
+                 help='show cache statistics')
+    p.disable_interspersed_args()
+    (opts, args) = p.parse_args(sys.argv[1:])
+    if opts.directory is None:
+        p.error('cache directory has to be specified')
+
+    cache = ObjectCache(opts.directory, parse_size(opts.max_size))
+    if opts.show_stats:
+        stats = cache.read_stats()
+        print('%s, size: %d' % (format_stats(stats), stats['size']))
+        sys.exit(0)
+    if not args:
+        p.error('compiler command line is missing')
+    if not os.path.isdir(opts.directory):
+        try:
+            os.makedirs(opts.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    sys.exit(cache.compile(Compilation(args),
+                           PathMap(os.getcwd(), opts.variant_dir)))
@@ -0,0 +1,114 @@
+"""generated files output
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+All generated artifacts are rendered into memory first. The existing file
+is left untouched when its content hash matches the rendered content, so
+that timestamps of byte identical files don't trigger any downstream work.
+
+Note: targets written via this module have to be declared Precious,
+otherwise scons removes them before running the action.
+"""
+import atexit
+import hashlib
+import os
+import pila.verbosity
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class WriteStats(object):
+    """Counts written and skipped generated files"""
+    def __init__(self):
+        self.written = 0
+        self.skipped = 0
+
+    def report(self):
+        if self.written or self.skipped:
+            print('pila: generated files written: {}, unchanged: {}'.format(
+                self.written, self.skipped))
+
+
+stats = WriteStats()
+
+
+def file_digest(path, block_size=65536):
+    """
+    @return md5 digest of the file content or None when the file doesn't
+    exist
+    """
+    digest = hashlib.md5()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    except IOError:
+        return None
+
+    return digest.digest()
+
+
+def write_if_changed(path, content):
+    """Writes content into the file unless it already contains it.
+
+    @param path - path to the output file
+    @param content - complete content of the file
+    @return True when the file has been written
+    """
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    try:
+        unchanged = os.path.getsize(path) == len(content) and \
+            file_digest(path) == hashlib.md5(content).digest()
+    except OSError:
+        unchanged = False
+
+    if unchanged:
+        stats.skipped += 1
+    else:
+        with open(path, 'wb') as f:
+            f.write(content)
+        stats.written += 1
+
+    return not unchanged
+
+
+class GeneratedFile(object):
+    """Context manager that provides an in-memory output file.
+
+    The content is written via write_if_changed() when the context is
+    left without an exception.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.buffer = StringIO()
+        self.changed = False
+
+    def __enter__(self):
+        return self.buffer
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.changed = write_if_changed(self.path,
+                                            self.buffer.getvalue())
+        self.buffer.close()
+
+
+if not pila.verbosity.verbosity_is_off():
+    atexit.register(stats.report)
@@ -0,0 +1,147 @@
+"""precompiled headers
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+A precompiled header of an environment combines the configuration header
+with a set of common headers (e.g. HAL or RTOS headers). C sources of
+the environment's feature objects are compiled with '-include <header>'
+instead of '-imacros $CONFIG_HEADER', GCC picks up <header>.gch that
+lies next to the header. When the precompiled header cannot be used
+(e.g. an object overrides the optimization flags), GCC warns and
+includes the header textually, i.e. the result is the same.
+
+The precompiled header is compiled with the flags of the environment and
+depends on the configuration header and all headers it includes. Objects
+depend on the precompiled header, a configuration change therefore
+recompiles all objects of the environment.
+"""
+import os
+import SCons.Scanner.C
+import pila.output
+import pila.verbosity
+
+# only C sources are compiled with the precompiled header, assembler and
+# C++ sources are given the configuration macros only
+pch_suffixes = ('.c',)
+
+
+def config_flags(target, source, env, for_signature):
+    """
+    Provides compiler flags that inject the configuration, i.e. the
+    precompiled header of the environment if there is one
+    """
+    header = env.get('PILA_PCH_HEADER')
+    if header is not None and source and \
+       str(source[0]).endswith(pch_suffixes):
+        return ['-Winvalid-pch', '-include', header.path]
+    return ['-imacros', '$CONFIG_HEADER']
+
+
+def resolve_include(source_dir, header_dir, include):
+    """
+    Headers that lie next to the SConscript are referred to relative to the
+    generated header, the source directory need not be on the include path
+    (e.g. variant directory without duplication)
+
+    @param source_dir - source directory of the SConscript
+    @param header_dir - directory of the generated header
+    @param include - common header, e.g. 'hal.h' or '<stdint.h>'
+    @return header name as it is to be included
+    """
+    if include.startswith('<'):
+        return include
+    node = source_dir.File(include)
+    if not node.exists():
+        return include
+    return os.path.relpath(node.abspath, header_dir.abspath)
+
+
+def pch_header_content(includes):
+    """
+    @return content of the header that is to be precompiled
+    """
+    lines = ['/* generated by pila: precompiled header */']
+    for include in includes:
+        if not include.startswith('<'):
+            include = '"{}"'.format(include)
+        lines.append('#include {}'.format(include))
+    return '\n'.join(lines) + '\n'
+
+
+def create_pch_header(env, target, source):
+    """Creates the header that is to be precompiled
+
+    :param env: environment with $PILA_PCH_INCLUDES
+    :param target: header
+    :param source: value with the list of common headers
+    """
+    with pila.output.GeneratedFile(str(target[0])) as header:
+        header.write(pch_header_content(env['PILA_PCH_INCLUDES']))
+
+
+pch_header_action = pila.verbosity.Action(create_pch_header, '[PCH] $TARGET')
+pch_action = pila.verbosity.Action(
+    '$CC -x c-header -o $TARGET -c $CFLAGS $CCFLAGS $_CCCOMCOM $SOURCES',
+    '[PCH] $TARGET')
+
+
+def PrecompiledHeader(env, headers=None, name='pch.pila.h'):
+    """
+    Provides a precompiled header that is used by all feature objects
+    subsequently declared in the environment (typically, the project
+    environment in its SConscript).
+
+    @param headers - common headers, e.g. ['hal.h', '<stdint.h>'],
+    defaults to $PCH_HEADERS. The configuration header is always included
+    first. Headers next to the SConscript are found even when its
+    directory is not on the include path.
+    @param name - name of the header in the current variant directory
+    @return the precompiled header node
+    """
+    if headers is None:
+        headers = env['PCH_HEADERS']
+    source_dir = env.Dir('.').srcnode()
+    header_dir = env.File(name).dir
+    includes = [env.subst('$CONFIG_HEADER')] + \
+        [resolve_include(source_dir, header_dir, env.subst(h))
+         for h in env.Flatten(headers)]
+    header = env.Command(name, env.Value(repr(includes)),
+                         action=pch_header_action,
+                         PILA_PCH_INCLUDES=includes)
+    # the header is rewritten only when its content changes
+    env.Precious(header)
+    # the precompiled header itself is compiled without the injected
+    # configuration, the header includes it
+    pch = env.Command('%s.gch' % name, header, action=pch_action,
+                      source_scanner=SCons.Scanner.C.CScanner(),
+                      _PILA_CONFIG_FLAGS='')
+    env.Depends(pch, env.subst('#$VARIANT_DIR/$CONFIG_HEADER'))
+    # generators of foreign build descriptions (see ninja module) create
+    # the header and the precompiled header on their own
+    header[0].attributes.pila_content = pch_header_content(includes)
+    pch[0].attributes.pila_pch = True
+    env['PILA_PCH_HEADER'] = header[0]
+    env['PILA_PCH'] = pch[0]
+
+    return pch[0]
+
+
+def add_dependencies(env, objects):
+    """Makes objects depend on the precompiled header of the environment
+    """
+    pch = env.get('PILA_PCH')
+    if pch is not None:
+        env.Depends(objects, pch)
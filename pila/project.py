@@ -15,6 +15,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
+import SCons.Errors
 import SCons.Warnings
 import os
 import traceback
@@ -23,10 +24,46 @@ class ProjectToolLoadFailed(SCons.Warnings.Warning):
     pass
 
 
+class UnknownOptProfile(SCons.Warnings.Warning):
+    pass
+
+
 def get_project_path(env, kconfig_prefix):
     return getattr(env['CONFIG'], '%s_DIR' % kconfig_prefix)
 
 
+def opt_profile_flags(env, profile):
+    """
+    @return optimization flags of the profile (see $OPT_PROFILES)
+    """
+    try:
+        return env['OPT_PROFILES'][profile]
+    except KeyError:
+        raise SCons.Errors.StopError(UnknownOptProfile,
+                                     'Unknown optimization profile: {}, '
+                                     'known profiles: {}'.format(
+                                         profile,
+                                         ', '.join(sorted(env['OPT_PROFILES']))))
+
+
+def opt_flags(target, source, env, for_signature):
+    """
+    Provides optimization flags of the target. The profile of the feature
+    object ($PILA_OPT_PROFILE) takes precedence over the profile of the
+    project the target belongs to, $CCFLAGS_OPT is used otherwise.
+    """
+    profile = env.get('PILA_OPT_PROFILE')
+    if not profile and target:
+        path = target[0].path
+        for directory, project_profile in env['PILA_PROJECT_OPT_PROFILES']:
+            if path.startswith(directory + os.sep):
+                profile = project_profile
+                break
+    if profile:
+        return opt_profile_flags(env, profile)
+    return '$CCFLAGS_OPT'
+
+
 def LoadProject(env, kconfig_prefix, tool_name=None,
                 tool_rel_path=os.path.join('site_scons', 'site_tools')):
     """
@@ -99,9 +136,16 @@ def ProjectSConscript(env, kconfig_prefix, use_root_variant_dir=True,
         project_path = get_project_path(env, prefix)
         # extract project directory name from its normalized path
         project_name = os.path.basename(os.path.realpath(project_path))
+        project_variant_dir = os.path.join(variant_dir, project_name)
+        # Optimization profile of the project (<PREFIX>_OPT_PROFILE) is
+        # applied to all objects built in its variant directory
+        profile = getattr(env['CONFIG'], '%s_OPT_PROFILE' % prefix)
+        if profile:
+            opt_profile_flags(env, profile)
+            env.Append(PILA_PROJECT_OPT_PROFILES=[
+                (env.Dir(project_variant_dir).path, profile)])
         env.FeatureSConscript(dirs=[project_path],
-                              variant_dir=os.path.join(variant_dir,
-                                                       project_name),
+                              variant_dir=project_variant_dir,
                               duplicate=0,
                               *args,
                               **kwargs)
@@ -0,0 +1,114 @@
+"""registry of build targets
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Feature objects, built-in objects and other items are collected in
+registries stored in construction variables (e.g. PILA_OBJECTS). Unlike
+env.Append() that copies the whole list, registration has constant
+cost. Cloning an environment doesn't copy the registry either, the clone
+refers to the items that have been registered in the original
+environment so far.
+"""
+import SCons.Util
+
+
+class Registry(object):
+    """Append-only sequence of registered items
+
+    @param parent - registry whose first parent_len items precede items
+    of this registry
+    """
+    def __init__(self, items=None, parent=None, parent_len=0):
+        self.items = list(items) if items else []
+        self.parent = parent
+        self.parent_len = parent_len
+
+    def add(self, items):
+        """Registers a single item or a list of items"""
+        if SCons.Util.is_List(items):
+            self.items.extend(items)
+        elif items is not None:
+            self.items.append(items)
+
+    def __len__(self):
+        return self.parent_len + len(self.items)
+
+    def __iter__(self):
+        segments = []
+        registry, visible = self, len(self)
+        while registry is not None:
+            segments.append((registry.items, visible - registry.parent_len))
+            visible = registry.parent_len
+            registry = registry.parent
+        for items, count in reversed(segments):
+            for i in range(count):
+                yield items[i]
+
+    def __eq__(self, other):
+        return isinstance(other, Registry) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __semi_deepcopy__(self):
+        """Called by env.Clone(), the clone sees items registered so far"""
+        if self.items:
+            return Registry(parent=self, parent_len=len(self))
+        # skip empty registries, so that chains of clones stay short
+        return Registry(parent=self.parent, parent_len=self.parent_len)
+
+    def __repr__(self):
+        return 'Registry({!r})'.format(list(self))
+
+
+def as_registry(value):
+    """Converts a value of the construction variable into a registry
+
+    SConscripts may have replaced the registry by a plain list (e.g.
+    env.Clone(PILA_OBJECTS=[])) or appended items via env.Append() that
+    turns the registry into a list nesting it.
+
+    @return registry with the items of the value
+    """
+    if isinstance(value, Registry):
+        return value
+    items = []
+    if value is not None:
+        for v in value if SCons.Util.is_List(value) else [value]:
+            if isinstance(v, Registry):
+                items.extend(v)
+            else:
+                items.append(v)
+    return Registry(items)
+
+
+def register(env, var, items):
+    """Registers items into the registry stored in the construction
+    variable, the registry is created if needed
+    """
+    registry = env.get(var)
+    if not isinstance(registry, Registry):
+        registry = env[var] = as_registry(registry)
+    registry.add(items)
+
+
+def registered(env, var):
+    """
+    @return list of all items registered in the construction variable
+    """
+    return list(as_registry(env.get(var)))
@@ -0,0 +1,111 @@
+"""configuration snapshot
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+The resolved configuration is stored as a pickled dictionary next to the
+.config. The snapshot is keyed by the hash of .config, pila version and
+the top level directory (paths in the configuration are absolute), so
+that builds without configuration changes load it without parsing
+.config or importing the generated python module.
+"""
+import hashlib
+import os
+import pila
+import pila.genconfig
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class Config(object):
+    """Configuration backed by a dictionary of symbols.
+
+    Symbols are accessed as attributes without the CONFIG_ prefix.
+    Non-existing symbols are rendered as if the configuration option is
+    not set.
+    """
+    __slots__ = ('_symbols',)
+
+    def __init__(self, symbols):
+        self._symbols = symbols
+
+    def __getattr__(self, attr):
+        # Only called for attributes other than the slot, special
+        # attributes must not be rendered as configuration options
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return self._symbols.get(attr, False)
+
+    def __reduce__(self):
+        return (Config, (self._symbols,))
+
+    def symbols(self):
+        """
+        @return dictionary of all symbols and their values
+        """
+        return self._symbols
+
+
+def config_from_table(table):
+    """Converts parsed .config into configuration object
+
+    @param table - pila.genconfig.ConfigTable
+    """
+    prefix_len = len('CONFIG_')
+    return Config(dict((config[prefix_len:],
+                        pila.genconfig.python_value(value))
+                       for config, value in table.symbols.items()))
+
+
+def write_atomically(path, data):
+    """Concurrent readers see either the old or the new file"""
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+
+def load_config(dot_config_path, snapshot_path):
+    """Loads configuration from the snapshot.
+
+    When the snapshot is missing or doesn't match the current .config,
+    the .config is parsed and a new snapshot is stored.
+
+    @return Config
+    """
+    with open(dot_config_path, 'rb') as dot_file:
+        dot_config = dot_file.read()
+    key = (pila.__version__, hashlib.md5(dot_config).hexdigest(),
+           os.getcwd())
+
+    try:
+        with open(snapshot_path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot['key'] == key:
+            return Config(snapshot['symbols'])
+    except Exception:
+        # missing or corrupted snapshot is simply regenerated
+        pass
+
+    with open(dot_config_path, 'r') as dot_file:
+        config = config_from_table(pila.genconfig.parse_dot_config(dot_file))
+    write_atomically(snapshot_path,
+                     pickle.dumps({'key': key, 'symbols': config.symbols()},
+                                  pickle.HIGHEST_PROTOCOL))
+
+    return config
@@ -0,0 +1,213 @@
+"""stack usage analysis
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+When ENABLE_STACK_USAGE is set, feature objects are compiled with
+-fstack-usage and -fcallgraph-info=su. Call graphs of all objects linked
+into a component program are merged after the link and the worst case
+stack depth of each entry point (function that is not called by any
+other function) is reported in <program>.stack-usage. The build fails
+when the depth of an entry point exceeds its budget ($STACK_BUDGETS).
+
+Recursion, indirect calls, calls of functions without call graph
+information (e.g. libraries) and unbounded dynamic stack allocation make
+the depth a lower bound only, such entry points are marked in the report.
+"""
+import os
+import re
+import pila.events
+import pila.output
+import pila.registry
+import pila.verbosity
+
+indirect_call = '__indirect_call'
+
+node_re = re.compile(r'^node: \{ title: "([^"]*)" label: "([^"]*)"')
+edge_re = re.compile(r'^edge: \{ sourcename: "([^"]*)" '
+                     r'targetname: "([^"]*)"')
+# stack usage line of the node label, e.g. 16 bytes (dynamic,bounded)
+usage_re = re.compile(r'\\n(\d+) bytes \(([^)]*)\)')
+
+
+def call_graph_files(obj):
+    """
+    @return call graph (.ci) and stack usage (.su) files produced by the
+    compiler along with the object
+    """
+    base = os.path.splitext(obj.name)[0]
+    return [obj.dir.File(base + '.ci'), obj.dir.File(base + '.su')]
+
+
+class Function(object):
+    """Call graph node"""
+    __slots__ = ('name', 'stack', 'dynamic', 'callees')
+
+    def __init__(self, name, stack, dynamic):
+        self.name = name
+        self.stack = stack
+        self.dynamic = dynamic
+        self.callees = []
+
+
+class CallGraph(object):
+    """Call graph merged from all objects of a component program"""
+    def __init__(self):
+        self.functions = {}
+        self.calls = []
+        self.worst = {}
+
+    def parse(self, ci_file):
+        for line in ci_file:
+            match = node_re.match(line)
+            if match:
+                usage = usage_re.search(match.group(2))
+                # nodes without stack usage are declarations only
+                if usage:
+                    self.functions[match.group(1)] = Function(
+                        match.group(1), int(usage.group(1)),
+                        usage.group(2) == 'dynamic')
+                continue
+            match = edge_re.match(line)
+            if match:
+                self.calls.append((match.group(1), match.group(2)))
+
+    def link(self):
+        """Resolves calls among all parsed objects
+
+        @return set of entry points
+        """
+        called = set()
+        for caller, callee in self.calls:
+            if caller in self.functions:
+                self.functions[caller].callees.append(callee)
+                called.add(callee)
+
+        return set(self.functions) - called
+
+    def worst_case(self, name, active):
+        """
+        @param active - functions on the current call path
+        @return tuple (depth, call path, set of notes)
+        """
+        return self.search(name, active)[0]
+
+    def search(self, name, active):
+        """
+        Results are memoized only when no recursion has been cut off within
+        the subtree of the function, otherwise they depend on the call
+        path.
+
+        @param active - functions on the current call path
+        @return tuple (worst case, functions on the call path where
+        recursion has been cut off)
+        """
+        if name in self.worst:
+            return self.worst[name], set()
+        function = self.functions.get(name)
+        if function is None:
+            note = 'indirect call' if name == indirect_call else \
+                   'unknown callee {}'.format(name)
+            return (0, [], set([note])), set()
+        if name in active:
+            return (0, [], set(['recursion {}'.format(name)])), set([name])
+
+        active.add(name)
+        depth, path, notes = 0, [], set()
+        cut_off = set()
+        for callee in function.callees:
+            (callee_depth, callee_path, callee_notes), callee_cut_off = \
+                self.search(callee, active)
+            notes.update(callee_notes)
+            cut_off.update(callee_cut_off)
+            if callee_depth > depth or not path:
+                depth, path = callee_depth, callee_path
+        active.discard(name)
+        if function.dynamic:
+            notes.add('dynamic stack {}'.format(name))
+        result = (function.stack + depth, [name] + path, notes)
+        if not cut_off:
+            self.worst[name] = result
+
+        return result, cut_off
+
+
+def analyze_stack_usage(env, target, source):
+    """Reports worst case stack depth of all entry points
+
+    :param env: environment with $STACK_BUDGETS
+    :param target: stack usage report
+    :param source: component program, budgets value and objects
+    """
+    graph = CallGraph()
+    for obj in source[2:]:
+        ci_path = call_graph_files(obj)[0].abspath
+        if os.path.exists(ci_path):
+            with open(ci_path) as ci_file:
+                graph.parse(ci_file)
+    entry_points = graph.link()
+    budgets = env['STACK_BUDGETS']
+    exceeded = []
+    with pila.output.GeneratedFile(str(target[0])) as report:
+        report.write('# entry point, worst case stack depth, budget, call '
+                     'path, notes\n')
+        for name in sorted(entry_points | set(budgets)):
+            depth, path, notes = graph.worst_case(name, set())
+            budget = budgets.get(name)
+            if budget is not None and depth > budget:
+                exceeded.append((name, depth, budget))
+            report.write('{} {} {} {} {}\n'.format(
+                name, depth, budget if budget is not None else '-',
+                ' -> '.join(path) or '-', '; '.join(sorted(notes)) or '-'))
+
+    for name, depth, budget in exceeded:
+        print('Stack budget of {} exceeded: {} bytes, budget {} bytes (see '
+              '{})'.format(name, depth, budget, target[0]))
+    return 1 if exceeded else 0
+
+
+class StackUsage(object):
+    """Collects objects of component programs for the stack usage
+    analysis
+    """
+    def __init__(self):
+        self.analyze_action = \
+            pila.verbosity.Action(analyze_stack_usage,
+                                  '[stack usage] $TARGET')
+
+    def register_feature_object(self, env, target, source, *args, **kw):
+        pass
+
+    def register_built_in_object(self, env, target_env, built_in_name, *args,
+                                 **kw):
+        objects = pila.registry.registered(env, 'PILA_OBJECTS')
+        for obj in env.Flatten(objects):
+            env.Clean(obj, call_graph_files(obj))
+        pila.registry.register(target_env, 'PILA_STACK_USAGE_OBJECTS',
+                               objects)
+
+    def register_component_program(self, env, target, *args, **kw):
+        """Analyzes the stack usage after the program has been linked"""
+        objects = pila.registry.registered(env, 'PILA_STACK_USAGE_OBJECTS')
+        report = env.Command('%s.stack-usage' % target,
+                             [target, env.Value(repr(sorted(
+                                 env['STACK_BUDGETS'].items())))] + objects,
+                             action=self.analyze_action)
+        env.Precious(report)
+
+
+def setup(env):
+    env.Append(CCFLAGS=['-fstack-usage', '-fcallgraph-info=su'])
+    pila.events.dispatcher.subscribe(StackUsage())
@@ -0,0 +1,283 @@
+"""build actions tracing
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+When PILA_TRACE=1 is specified on the command line, wall and CPU time of
+every build action is recorded. External commands are spawned directly,
+so that resource usage of each of them is available. Python function
+actions created by verbosity.Action are timed, too.
+
+At the end of the build, the trace is stored in Chrome trace event
+format ($PILA_TRACE_FILE) that can be loaded into chrome://tracing or
+Perfetto and the slowest objects and built-ins are reported.
+"""
+import atexit
+import json
+import os
+import subprocess
+import threading
+import time
+import SCons.Action
+import SCons.Script
+import SCons.Util
+import pila.events
+import pila.registry
+
+# number of the slowest targets reported in the summary
+summary_size = 10
+
+thread_time = getattr(time, 'thread_time', None)
+
+
+def tracing_is_on():
+    return SCons.Script.ARGUMENTS.get('PILA_TRACE') == '1'
+
+
+def action_target(target, executor):
+    """
+    @return name of the first target of the action being executed, targets
+    are provided by the executor when SCons doesn't print the action
+    """
+    if executor:
+        target = executor.get_all_targets()
+    return str(target[0]) if target else None
+
+
+class TraceRecord(object):
+    """Timing of a single action"""
+    __slots__ = ('target', 'start', 'duration', 'cpu', 'thread')
+
+    def __init__(self, target, start, duration, cpu, thread):
+        self.target = target
+        self.start = start
+        self.duration = duration
+        self.cpu = cpu
+        self.thread = thread
+
+
+class Hierarchy(object):
+    """Events subscriber that notes pila hierarchy of targets: feature
+    objects -> (built-in object parts ->) built-in objects -> component
+    programs
+
+    Targets are named by their paths relative to the top level directory.
+    Built-ins and parts are mapped to their inputs (see BuiltInObject
+    chunk_size).
+    """
+    def __init__(self):
+        self.objects = set()
+        self.parts = {}
+        self.built_ins = {}
+        self.programs = {}
+
+    def register_feature_object(self, env, target, source, *args, **kw):
+        pass
+
+    def register_built_in_object(self, env, target_env, built_in_name, *args,
+                                 **kw):
+        objects = set(o.path for o in env.Flatten(
+            pila.registry.registered(env, 'PILA_OBJECTS')))
+        self.objects.update(objects)
+        built_in = env.File(built_in_name)
+        for part in built_in.sources:
+            if part.path not in objects:
+                self.parts[part.path] = [o.path for o in part.sources]
+        self.built_ins[built_in.path] = [s.path for s in built_in.sources]
+
+    def members(self, built_in):
+        """
+        @return all targets the built-in object is composed from (objects
+        and parts)
+        """
+        result = []
+        for i in self.built_ins[built_in]:
+            result.extend(self.parts.get(i, []))
+            result.append(i)
+        return result
+
+    def register_component_program(self, env, target, *args, **kw):
+        for program in env.File(env.Flatten(target)):
+            self.programs[program.path] = [
+                b.path for b in env.Flatten(
+                    pila.registry.registered(env, 'PILA_BUILTINS'))]
+
+    def kind(self, target):
+        if target in self.objects:
+            return 'object'
+        if target in self.built_ins or target in self.parts:
+            return 'built-in'
+        if target in self.programs:
+            return 'program'
+        return 'other'
+
+
+class Tracer(Hierarchy):
+    """Records timing of build actions
+
+    The tracer is also an events subscriber, so that it knows which
+    targets are feature objects, built-in objects and component programs.
+    """
+    def __init__(self):
+        Hierarchy.__init__(self)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.records = []
+        self.threads = {}
+        self.start = time.time()
+        self.spawn_func = None
+
+    def thread_index(self):
+        ident = threading.current_thread().ident
+        with self.lock:
+            return self.threads.setdefault(ident, len(self.threads))
+
+    def add(self, target, start, duration, cpu):
+        record = TraceRecord(target, start - self.start, duration, cpu,
+                             self.thread_index())
+        with self.lock:
+            self.records.append(record)
+
+    def spawn(self, sh, escape, cmd, args, env):
+        """Spawns the command and records its wall and CPU time
+
+        @return exit status of the command
+        """
+        target = getattr(self.local, 'target', None) or cmd
+        start = time.time()
+        if not hasattr(os, 'wait4'):
+            status = self.spawn_func(sh, escape, cmd, args, env)
+            self.add(target, start, time.time() - start, None)
+            return status
+
+        proc = subprocess.Popen([sh, '-c', ' '.join(args)], env=env,
+                                close_fds=True)
+        pid, status, rusage = os.wait4(proc.pid, 0)
+        # the process has been reaped already
+        proc.returncode = status
+        self.add(target, start, time.time() - start,
+                 rusage.ru_utime + rusage.ru_stime)
+        if os.WIFSIGNALED(status):
+            return 128 + os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+    def targeted_execute(self, execute):
+        """
+        @return execute method of command actions that notes the target
+        for spawns of all commands of the action in this thread
+        """
+        tracer = self
+
+        def execute_with_target(action, target, source, env, executor=None):
+            tracer.local.target = action_target(target, executor)
+            try:
+                return execute(action, target, source, env,
+                               executor=executor)
+            finally:
+                tracer.local.target = None
+
+        return execute_with_target
+
+    def timed_action(self, action):
+        """Times execution of the python function action
+
+        The action signature is not affected as only the execute method
+        of the instance is replaced.
+        """
+        execute = action.execute
+        tracer = self
+
+        def timed_execute(target, source, env, executor=None):
+            start = time.time()
+            cpu_start = thread_time() if thread_time else None
+            try:
+                return execute(target, source, env, executor=executor)
+            finally:
+                cpu = thread_time() - cpu_start if thread_time else None
+                tracer.add(action_target(target, executor), start,
+                           time.time() - start, cpu)
+
+        action.execute = timed_execute
+        return action
+
+    def setup(self, env):
+        """Routes spawning of commands through the tracer, the target of
+        each spawn is taken from the command action being executed"""
+        self.spawn_func = env['SPAWN']
+        env['SPAWN'] = self.spawn
+        SCons.Action.CommandAction.execute = self.targeted_execute(
+            SCons.Action.CommandAction.execute)
+        pila.events.dispatcher.subscribe(self)
+        atexit.register(self.report, env)
+
+    @classmethod
+    def project_dirs(clz, env):
+        """
+        @return list of (directory, kconfig prefix) of all projects in the
+        configuration (<PREFIX>_DIR symbols), longest paths first
+        """
+        if 'CONFIG' not in env or not hasattr(env['CONFIG'], 'symbols'):
+            return []
+        dirs = []
+        for symbol, value in env['CONFIG'].symbols().items():
+            if symbol.endswith('_DIR') and SCons.Util.is_String(value):
+                dirs.append((os.path.realpath(value) + os.sep, symbol[:-4]))
+
+        return sorted(dirs, key=lambda d: len(d[0]), reverse=True)
+
+    def project(self, env, target, project_dirs):
+        path = os.path.realpath(env.File('#' + target).srcnode().abspath)
+        for directory, prefix in project_dirs:
+            if path.startswith(directory):
+                return prefix
+        return None
+
+    def report(self, env):
+        """Stores the trace and prints summary of the slowest targets"""
+        if not self.records:
+            return
+        jobs = SCons.Script.GetOption('num_jobs')
+        project_dirs = self.project_dirs(env)
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': t,
+                   'args': {'name': 'job {}'.format(t)}}
+                  for t in sorted(self.threads.values())]
+        for r in self.records:
+            args = {'project': self.project(env, r.target, project_dirs)}
+            if r.cpu is not None:
+                args['cpu_ms'] = round(r.cpu * 1000, 3)
+            events.append({'name': r.target, 'cat': self.kind(r.target),
+                           'ph': 'X', 'pid': 1, 'tid': r.thread,
+                           'ts': int(r.start * 1e6),
+                           'dur': int(r.duration * 1e6), 'args': args})
+        trace_file = env.subst('$PILA_TRACE_FILE')
+        with open(trace_file, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'jobs': jobs}}, f)
+
+        print('pila trace: {} actions, {:.3f} s, {} jobs, stored in {}'.format(
+            len(self.records), time.time() - self.start, jobs, trace_file))
+        for kind in ('object', 'built-in'):
+            records = sorted((r for r in self.records
+                              if self.kind(r.target) == kind),
+                             key=lambda r: r.duration, reverse=True)
+            if records:
+                print('slowest {}s:'.format(kind))
+            for r in records[:summary_size]:
+                cpu = ' (cpu {:.3f} s)'.format(r.cpu) if r.cpu is not None \
+                      else ''
+                print('  {:8.3f} s{} {}'.format(r.duration, cpu, r.target))
+
+
+tracer = Tracer() if tracing_is_on() else None
@@ -0,0 +1,129 @@
+"""unity (jumbo) builds
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+When ENABLE_UNITY_BUILD is set, C sources of feature objects are not
+compiled one by one. They are collected per environment and
+BuiltInObject groups them into unity translation units that include the
+sources. Groups are formed the same way as built-in object chunks
+(see builders.chunk_objects), i.e. membership is derived from source
+paths, so that adding or editing a source affects only its group.
+
+Feature objects with builder overrides, explicit targets or sources
+matching $UNITY_EXCLUDE are compiled separately.
+"""
+import fnmatch
+import os
+import pila.builders
+import pila.output
+import pila.registry
+import pila.verbosity
+
+
+def is_excluded(env, node):
+    """
+    @return True when the source matches any pattern of $UNITY_EXCLUDE,
+    patterns are matched against the source path relative to the top
+    level directory and against the file name
+    """
+    path = node.srcnode().path
+    for pattern in env['UNITY_EXCLUDE']:
+        if fnmatch.fnmatch(path, pattern) or \
+           fnmatch.fnmatch(node.name, pattern):
+            return True
+    return False
+
+
+def unity_sources(env, target, source, args, kw):
+    """
+    @return list of source nodes of the feature object when they can be
+    compiled as part of a unity translation unit, None otherwise
+    """
+    if target is not None or args or kw:
+        return None
+    sources = [env.File(s) for s in env.Flatten(source)]
+    if not sources or [s for s in sources
+                       if s.suffix != '.c' or is_excluded(env, s)]:
+        return None
+    return sources
+
+
+def unity_source_content(includes):
+    """
+    @return content of the unity translation unit
+    """
+    lines = ['/* generated by pila: unity translation unit of {} '
+             'sources */'.format(len(includes))]
+    for path in includes:
+        lines.append('#include "{}"'.format(path))
+    return '\n'.join(lines) + '\n'
+
+
+def create_unity_source(env, target, source):
+    """Creates the unity translation unit
+
+    :param env: environment with $PILA_UNITY_INCLUDES
+    :param target: unity source
+    :param source: value with the list of included sources
+    """
+    with pila.output.GeneratedFile(str(target[0])) as unity:
+        unity.write(unity_source_content(env['PILA_UNITY_INCLUDES']))
+
+
+unity_action = pila.verbosity.Action(create_unity_source, '[unity] $TARGET')
+
+
+def UnityGroups(env, built_in_name, sources, group_size):
+    """Provides unity translation units of the sources
+
+    @param built_in_name - name of the built-in object, unity sources are
+    named after it
+    @param sources - source nodes
+    @param group_size - average number of sources in a group
+    @return list of (source, group sources), groups of a single source
+    are compiled directly
+    """
+    result = []
+    base = os.path.splitext(built_in_name)[0]
+    for group in pila.builders.chunk_objects(sources, group_size):
+        if len(group) == 1:
+            result.append((group[0], group))
+            continue
+        includes = [s.srcnode().abspath for s in group]
+        unity = env.Command('{}.unity-{:08x}.c'.format(
+                                base, pila.builders.path_digest(group[0])),
+                            env.Value(repr(includes)), action=unity_action,
+                            PILA_UNITY_INCLUDES=includes)
+        # the unity source is rewritten only when its content changes
+        env.Precious(unity)
+        # generators of foreign build descriptions (see ninja module)
+        # create the unity source on their own
+        unity[0].attributes.pila_content = unity_source_content(includes)
+        result.append((unity[0], group))
+
+    return result
+
+
+def register(env, sources):
+    """Defers compilation of the sources until the built-in object of the
+    environment is declared
+    """
+    pila.registry.register(env, 'PILA_UNITY_SOURCES', sources)
+
+
+def registered(env):
+    return env.Flatten(pila.registry.registered(env, 'PILA_UNITY_SOURCES'))
+
@@ -0,0 +1,93 @@
+"""multi-variant builds
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+When multiple configurations are built in a single run, an object is
+compiled only once for all variants whose compiler command line
+(normalized with regards to the variant directory) and values of all
+configuration symbols referenced by the source are identical.
+"""
+import re
+import pila.configdeps
+
+# construction variables that determine the resulting object
+signature_vars = '$CC $CXX $CFLAGS $CCFLAGS $CXXFLAGS $_CCCOMCOM ' \
+                 '$ASFLAGS $ASPPFLAGS $OBJSUFFIX'
+
+
+class ObjectPool(object):
+    """Feature objects shared among build variants"""
+    def __init__(self):
+        self.objects = {}
+        self.variants = set()
+        self.compilations = 0
+        self.deduplicated = 0
+
+    def signature(self, env, overrides):
+        """
+        @return compiler flags signature with variant directory
+        references normalized
+        """
+        if overrides:
+            env = env.Override(overrides)
+        variant_dir = re.escape(env.subst('$VARIANT_DIR'))
+        return re.sub(r'(?<![\w.-])%s(?=/|\s|$)' % variant_dir,
+                      '$VARIANT_DIR', env.subst(signature_vars))
+
+    def key(self, env, source, signature):
+        """
+        @return key that identifies the object or None when the source
+        cannot be scanned for configuration symbols
+        """
+        source_path = env.File(source).srcnode().abspath
+        symbols = pila.configdeps.scanner.scan(
+            source_path, pila.configdeps.include_search_path(env),
+            (env.subst('$CONFIG_HEADER'),))
+        if symbols is None:
+            return None
+        config = env['CONFIG']
+        # optimization profile of the project depends on the location
+        opt_flags = env.subst('$_PILA_CCFLAGS_OPT', target=env.File(source))
+        return (source_path, signature, opt_flags,
+                tuple((s, getattr(config, s)) for s in sorted(symbols)))
+
+    def Object(self, env, source, **kw):
+        """Provides objects for all sources, objects already compiled for
+        another variant are reused.
+
+        @return list of object nodes
+        """
+        self.variants.add(env.subst('$VARIANT_DIR'))
+        signature = self.signature(env, kw)
+        result = []
+        for s in env.Flatten(source):
+            key = self.key(env, s, signature)
+            obj = self.objects.get(key) if key is not None else None
+            if obj is None:
+                obj = env.Object(s, **kw)
+                pila.configdeps.add_config_dependencies(env, obj, s)
+                self.compilations += 1
+                if key is not None:
+                    self.objects[key] = obj
+            else:
+                self.deduplicated += 1
+            result.extend(obj)
+
+        return result
+
+    def report(self):
+        print('pila: {} variants, {} compilations, {} deduplicated'.format(
+            len(self.variants), self.compilations, self.deduplicated))
@@ -16,6 +16,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>
 """
 import SCons.Action
+import pila.trace
 # Note: if the API changes, we have to rework this import!
 from SCons.Script import ARGUMENTS
 
@@ -30,9 +31,17 @@ def Action(act, *args, **kwargs):
     """
     if verbosity_is_off():
         result_action = SCons.Action.Action(act, *args, **kwargs)
+    elif pila.trace.tracer is not None:
+        result_action = SCons.Action.Action(act)
     else:
         result_action = act
 
+    # Function actions are timed when tracing, command actions are timed
+    # when being spawned (see trace module)
+    if pila.trace.tracer is not None and \
+       isinstance(result_action, SCons.Action.FunctionAction):
+        result_action = pila.trace.tracer.timed_action(result_action)
+
     return result_action
 
 
@@ -0,0 +1,65 @@
+"""builders tests
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+Run with scons (its engine) on the python path, e.g.:
+PYTHONPATH=<scons engine dir> python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import SCons.Environment
+import pila.builders
+
+
+class LinkSourcesTest(unittest.TestCase):
+    """Command line of a component program linked from built-in archives"""
+    link_command = '$LINK -o $TARGET -Map=${TARGET}.map $_PILA_LINK_SOURCES'
+
+    def link_args(self, **kw):
+        env = SCons.Environment.Environment(
+            tools=[], LINK='ld',
+            _PILA_LINK_SOURCES=pila.builders.link_sources, **kw)
+        archive = env.File('build/src/built-in.a')
+        archive.attributes.pila_built_in_archive = True
+        obj = env.File('build/lib/built-in.o')
+        target = env.File('build/prog')
+        return [str(a) for a in env.subst_list(self.link_command,
+                                               target=[target],
+                                               source=[archive, obj])[0]]
+
+    def test_archive_without_lto(self):
+        self.assertEqual(self.link_args(LINKFLAGSPREFIX=''),
+                         ['ld', '-o', os.path.join('build', 'prog'),
+                          '-Map=' + os.path.join('build', 'prog.map'),
+                          '--whole-archive',
+                          os.path.join('build', 'src', 'built-in.a'),
+                          '--no-whole-archive',
+                          os.path.join('build', 'lib', 'built-in.o')])
+
+    def test_archive_with_linker_driver(self):
+        args = self.link_args(LINKFLAGSPREFIX='-Wl,')
+        self.assertEqual(args[4:7],
+                         ['-Wl,--whole-archive',
+                          os.path.join('build', 'src', 'built-in.a'),
+                          '-Wl,--no-whole-archive'])
+
+
+if __name__ == '__main__':
+    unittest.main()
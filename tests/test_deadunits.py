@@ -0,0 +1,121 @@
+"""dead translation unit elimination tests
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import SCons.Environment
+import pila.deadunits
+
+
+class ScanTest(unittest.TestCase):
+    def is_dead(self, content, symbols={}):
+        scan = pila.deadunits.scan_conditional_blocks(content)
+        if scan is None:
+            return False
+        blocks, includes = scan
+        return not includes and \
+            pila.deadunits.ConditionEvaluator(symbols).is_dead(blocks)
+
+    def test_disabled_block(self):
+        content = '#if defined(CONFIG_A) && CONFIG_N > 1\nint a;\n#endif\n'
+        self.assertTrue(self.is_dead(content))
+        self.assertTrue(self.is_dead(content, {'A': True, 'N': 1}))
+        self.assertFalse(self.is_dead(content, {'A': True, 'N': 2}))
+
+    def test_else_branch_is_alive(self):
+        self.assertFalse(self.is_dead('#ifdef CONFIG_A\n#else\nint a;\n'
+                                      '#endif\n'))
+
+    def test_unknown_identifier_is_alive(self):
+        self.assertFalse(self.is_dead('#ifdef __cplusplus\nint a;\n#endif\n'))
+
+    def test_code_outside_of_blocks_is_alive(self):
+        self.assertFalse(self.is_dead('int a;\n#if CONFIG_A\n#endif\n'))
+
+    def test_wrapper_without_blocks_is_alive(self):
+        self.assertEqual(pila.deadunits.scan_conditional_blocks(
+            '#include "impl.inc"\n'), ([], []))
+        self.assertFalse(self.is_dead('#include "impl.inc"\n'))
+        self.assertFalse(self.is_dead('#define X 1\n'))
+
+    def test_config_symbol_definition_is_alive(self):
+        self.assertIsNone(pila.deadunits.scan_conditional_blocks(
+            '#define CONFIG_A 1\n#if CONFIG_A\nint a;\n#endif\n'))
+        self.assertIsNone(pila.deadunits.scan_conditional_blocks(
+            '#if CONFIG_B\nint b;\n#endif\n#undef CONFIG_A\n'))
+
+    def test_include_preceding_block(self):
+        self.assertEqual(pila.deadunits.scan_conditional_blocks(
+            '#include "defaults.h"\n#if CONFIG_N > 2\nint a;\n#endif\n'
+            '#include "tail.h"\n'),
+            ([[('if', 'CONFIG_N > 2')]], ['"defaults.h"']))
+        self.assertFalse(self.is_dead(
+            '#include "defaults.h"\n#if CONFIG_N > 2\nint a;\n#endif\n'))
+
+
+class Config(object):
+    def symbols(self):
+        return {'FOO': True, 'BAR': False}
+
+
+class LiveSourcesTest(unittest.TestCase):
+    """Sources of a single feature object are evaluated one by one"""
+    sources = {
+        'l1.c': 'int l1;\n',
+        'l2.c': '#ifdef CONFIG_FOO\nint l2;\n#endif\n',
+        'dead.c': '#include "config.pila.h"\n#ifdef CONFIG_BAR\nint d;\n'
+                  '#endif\n',
+    }
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name, content in self.sources.items():
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(content)
+        self.env = SCons.Environment.Environment(
+            tools=[], CONFIG=Config(), CONFIG_HEADER='config.pila.h')
+        self.scanner = pila.deadunits.DeadUnitScanner()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def paths(self, *names):
+        return [os.path.join(self.dir, n) for n in names]
+
+    def test_mixed_sources(self):
+        sources = self.paths('l1.c', 'dead.c', 'l2.c')
+        self.assertEqual(self.scanner.live_sources(self.env, sources),
+                         self.paths('l1.c', 'l2.c'))
+        self.assertEqual(self.scanner.skipped, 1)
+        self.assertFalse(self.scanner.is_dead(self.env, sources))
+        self.assertEqual(self.scanner.skipped, 1)
+
+    def test_all_dead(self):
+        sources = self.paths('dead.c')
+        self.assertEqual(self.scanner.live_sources(self.env, sources), [])
+        self.assertTrue(self.scanner.is_dead(self.env, sources))
+        self.assertEqual(self.scanner.skipped, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
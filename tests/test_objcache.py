@@ -0,0 +1,100 @@
+"""object cache tests
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pila.objcache
+
+
+class PathMapTest(unittest.TestCase):
+    def path_maps(self):
+        return [pila.objcache.PathMap(top, variant_dir)
+                for top, variant_dir in (('/work/a', 'build-a'),
+                                         ('/ci/checkout', 'build-b'))]
+
+    def test_arguments_are_independent_of_the_checkout(self):
+        normalized = []
+        for path_map in self.path_maps():
+            top = path_map.top
+            args = ['-I' + top + 'src', '-isystem', top + 'include',
+                    '-I' + path_map.variant_dir, '-O2']
+            normalized.append([path_map.normalize_arg(a) for a in args])
+        self.assertEqual(normalized[0], normalized[1])
+        self.assertEqual(normalized[0], ['-Isrc', '-isystem', 'include',
+                                         '-I@VARIANT_DIR@', '-O2'])
+
+    def test_manifest_paths_resolve_in_the_current_tree(self):
+        first, second = self.path_maps()
+        path = first.normalize('build-a/config.pila.h')
+        self.assertEqual(second.resolve(path), 'build-b/config.pila.h')
+        self.assertEqual(first.normalize('/usr/include/stdio.h'),
+                         '/usr/include/stdio.h')
+
+    def test_line_markers(self):
+        path_map = self.path_maps()[0]
+        self.assertEqual(path_map.normalize_line_markers(
+            b'# 1 "/work/a/src/a.h" 1\nint a;\n# 2 "build-a/pch.h"\n'),
+            b'# 1 "src/a.h" 1\nint a;\n# 2 "@VARIANT_DIR@/pch.h"\n')
+
+
+class StackUsageTest(unittest.TestCase):
+    """Stack usage and call graph files are cached with the object"""
+    argv = ['gcc', '-c', '-fstack-usage', '-fcallgraph-info=su',
+            '-o', 'build/a.o', 'a.c']
+
+    def test_side_outputs(self):
+        compilation = pila.objcache.Compilation(self.argv)
+        self.assertTrue(compilation.cacheable)
+        self.assertEqual(compilation.side_suffixes, ['.su', '.ci'])
+        self.assertEqual(compilation.side_output('.su'),
+                         os.path.join('build', 'a.su'))
+
+    @unittest.skipIf(pila.objcache.find_executable('gcc') is None,
+                     'gcc is not available')
+    def test_cache_hit_restores_side_outputs(self):
+        cwd = os.getcwd()
+        top = tempfile.mkdtemp()
+        try:
+            os.chdir(top)
+            os.mkdir('build')
+            with open('a.c', 'w') as f:
+                f.write('int f(void) { volatile int a[4]; return a[0]; }\n')
+            cache = pila.objcache.ObjectCache(os.path.join(top, 'cache'),
+                                              1024 ** 2)
+            path_map = pila.objcache.PathMap(top, 'build')
+            for expected in ('misses', 'direct_hits'):
+                shutil.rmtree('build')
+                os.mkdir('build')
+                before = cache.read_stats()[expected]
+                self.assertEqual(cache.compile(
+                    pila.objcache.Compilation(self.argv), path_map), 0)
+                self.assertEqual(cache.read_stats()[expected], before + 1)
+                self.assertEqual(sorted(os.listdir('build')),
+                                 ['a.ci', 'a.o', 'a.su'])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(top)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""precompiled header tests
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import SCons.Environment
+import pila.pch
+
+
+class ResolveIncludeTest(unittest.TestCase):
+    """Common headers of a variant directory without duplication"""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, 'src'))
+        with open(os.path.join(self.dir, 'src', 'common.h'), 'w') as f:
+            f.write('#define COMMON 1\n')
+        env = SCons.Environment.Environment(tools=[])
+        self.source_dir = env.Dir(os.path.join(self.dir, 'src'))
+        self.header_dir = env.Dir(os.path.join(self.dir, 'build', 'src'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def resolve(self, include):
+        return pila.pch.resolve_include(self.source_dir, self.header_dir,
+                                        include)
+
+    def test_header_next_to_sconscript(self):
+        self.assertEqual(self.resolve('common.h'),
+                         os.path.join(os.pardir, os.pardir, 'src',
+                                      'common.h'))
+
+    def test_header_on_include_path(self):
+        self.assertEqual(self.resolve('hal.h'), 'hal.h')
+        self.assertEqual(self.resolve('<stdint.h>'), '<stdint.h>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""registry tests
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import SCons.Environment
+import pila.registry
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.env = SCons.Environment.Environment(
+            tools=[], PILA_OBJECTS=pila.registry.Registry())
+        pila.registry.register(self.env, 'PILA_OBJECTS', ['a'])
+
+    def test_clone_sees_registered_items(self):
+        clone = self.env.Clone()
+        pila.registry.register(clone, 'PILA_OBJECTS', 'b')
+        pila.registry.register(self.env, 'PILA_OBJECTS', 'c')
+        self.assertEqual(pila.registry.registered(clone, 'PILA_OBJECTS'),
+                         ['a', 'b'])
+        self.assertEqual(pila.registry.registered(self.env, 'PILA_OBJECTS'),
+                         ['a', 'c'])
+
+    def test_replaced_by_list(self):
+        clone = self.env.Clone(PILA_OBJECTS=[])
+        self.assertEqual(pila.registry.registered(clone, 'PILA_OBJECTS'), [])
+        pila.registry.register(clone, 'PILA_OBJECTS', 'b')
+        self.assertEqual(pila.registry.registered(clone, 'PILA_OBJECTS'),
+                         ['b'])
+        self.assertIsInstance(clone['PILA_OBJECTS'], pila.registry.Registry)
+
+    def test_extended_via_append(self):
+        self.env.Append(PILA_OBJECTS=['b'])
+        self.assertEqual(pila.registry.registered(self.env, 'PILA_OBJECTS'),
+                         ['a', 'b'])
+        pila.registry.register(self.env, 'PILA_OBJECTS', 'c')
+        self.assertEqual(pila.registry.registered(self.env, 'PILA_OBJECTS'),
+                         ['a', 'b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
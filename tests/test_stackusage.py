@@ -0,0 +1,58 @@
+"""stack usage analysis tests
+
+Copyright (c) 2017 Braiins Systems s.r.o.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pila.stackusage
+
+
+class WorstCaseTest(unittest.TestCase):
+    def call_graph(self, functions):
+        """
+        @param functions - dictionary of (stack, callees) indexed by name
+        """
+        graph = pila.stackusage.CallGraph()
+        for name, (stack, callees) in functions.items():
+            graph.functions[name] = pila.stackusage.Function(name, stack,
+                                                             False)
+            graph.functions[name].callees = callees
+        return graph
+
+    def test_shared_callee(self):
+        graph = self.call_graph({'a': (10, ['c']), 'b': (20, ['c']),
+                                 'c': (30, [])})
+        self.assertEqual(graph.worst_case('a', set()),
+                         (40, ['a', 'c'], set()))
+        self.assertEqual(graph.worst_case('b', set()),
+                         (50, ['b', 'c'], set()))
+
+    def test_cycle_reached_from_another_entry_point(self):
+        # a -> b -> c -> b, d -> c -> b -> c
+        graph = self.call_graph({'a': (10, ['b']), 'b': (20, ['c']),
+                                 'c': (30, ['b']), 'd': (5, ['c'])})
+        self.assertEqual(graph.worst_case('a', set()),
+                         (60, ['a', 'b', 'c'], set(['recursion b'])))
+        self.assertEqual(graph.worst_case('d', set()),
+                         (55, ['d', 'c', 'b'], set(['recursion c'])))
+
+
+if __name__ == '__main__':
+    unittest.main()